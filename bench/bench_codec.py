@@ -0,0 +1,65 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Throughput micro-benchmark for lib/codec.py
+# Usage: python bench/bench_codec.py [frames]
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lib.codec as codec
+
+appstring = b'iphone.3DEnabler.iapp.samsung'
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def encodeKeys(count):
+    return [codec.encodeKey(appstring, 'KEY_RIGHT') for _ in range(count)]
+
+def decodeStream(stream, chunk):
+    decoder = codec.FrameDecoder()
+    payloads = 0
+    for offset in range(0, len(stream), chunk):
+        payloads += len(decoder.feed(stream[offset:offset + chunk]))
+    return payloads
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    frames, encodeSec = timed(encodeKeys, count)
+    stream = b''.join(frames)
+    results = {
+        'frames': count,
+        'bytes': len(stream),
+        'encode_frames_per_sec': int(count / encodeSec),
+    }
+    for chunk in (7, 4096, len(stream)):
+        payloads, decodeSec = timed(decodeStream, stream, chunk)
+        assert payloads == count
+        name = 'decode_chunk_' + ('all' if chunk == len(stream) else str(chunk))
+        results[name + '_frames_per_sec'] = int(count / decodeSec)
+        results[name + '_mb_per_sec'] = round(len(stream) / decodeSec / 1e6, 2)
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# End-to-end benchmark of the service against fake Kodi modules, a fake TV and
+# a fake SSDP responder - no Kodi or Samsung TV needed. Results are printed as
+# JSON so runs of different builds can be compared.
+# Usage: python bench/bench_service.py [--iterations N] [--ack-latency MS] [--output FILE]
+# Key delays (P<ms>) only advance the virtual clock unless --realtime is given.
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(benchDir, 'stubs'), benchDir, os.path.dirname(benchDir)]
+
+import xbmc
+import xbmcaddon
+import faketv
+import fakessdp
+
+tvName = '[TV] Bench'
+tvUdn = 'uuid:bench-tv'
+
+def summary(samples):
+    samples = sorted(samples)
+    if not samples: return {'n': 0}
+    ms = lambda x: round(x * 1000, 3)
+    return {
+        'n': len(samples),
+        'min_ms': ms(samples[0]),
+        'p50_ms': ms(samples[len(samples) // 2]),
+        'p95_ms': ms(samples[min(len(samples) - 1, int(len(samples) * 0.95))]),
+        'max_ms': ms(samples[-1]),
+        'mean_ms': ms(sum(samples) / len(samples))
+    }
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def setUp(service):
+    # Same globals as service.main() creates, without starting the background threads
+    import xbmcgui
+    import lib.timing as timing
+    import lib.registry as registry
+    import lib.reachability as reachability
+    import lib.wsremote as wsremote
+    import lib.titlecache as titlecache
+    import lib.metrics as metrics
+    profile = xbmcaddon.profile
+    service.refreshLogLevel()
+    service.monitor = service.MyMonitor()
+    service.dialog = xbmcgui.Dialog()
+    service.dialogprogress = xbmcgui.DialogProgress()
+    service.blackScreen = xbmcgui.Window(-1)
+    service.responseMap = service.responsePayloadMapping()
+    service.settings = service.Settings()
+    service.session = service.TVSession()
+    service.profiles = timing.TimingProfiles(os.path.join(profile, 'timing.json'))
+    service.devices = registry.DeviceRegistry(os.path.join(profile, 'devices.json'))
+    service.tokens = wsremote.TokenStore(os.path.join(profile, 'tokens.json'))
+    service.stats = metrics.Metrics(os.path.join(profile, 'stats.json'))
+    service.syncTargets()
+    service.titles = titlecache.TitleModeCache(os.path.join(profile, 'titles.json'))
+    service.tracker = reachability.ReachabilityTracker(service.getTrackedIP, service.getTransportPorts(), onOnline = service.onTVOnline)
+    service.state = service.KodiState()
+    service.detector = service.Detector()
+    service.controller = service.Controller()
+
+def benchDiscover(service, iterations):
+    samples = []
+    found = 0
+    for _ in range(iterations):
+        tv, seconds = timed(service.discoverTVip)
+        samples.append(seconds)
+        if tv and tv[2] == tvUdn: found += 1
+    result = summary(samples)
+    result['found'] = found
+    return result
+
+def benchConnect(service, iterations):
+    samples = []
+    for _ in range(iterations):
+        connected, seconds = timed(service.connectTV)
+        if connected: samples.append(seconds)
+        service.session.close()
+    return summary(samples)
+
+def benchAuthenticate(service, iterations):
+    samples = []
+    for _ in range(iterations):
+        if not service.connectTV(): continue
+        granted, seconds = timed(service.authenticate)
+        if granted: samples.append(seconds)
+        service.session.close()
+    return summary(samples)
+
+def waitForAcks(service, timeout = 10):
+    deadline = time.monotonic() + timeout
+    pipeline = service.session.pipeline
+    while pipeline and pipeline.alive and pipeline.unacked() and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+def benchSequence(service, tv, iterations):
+    sent, acked, waited = [], [], []
+    keysBefore = len(tv.keys)
+    keysExpected = 0
+    for i in range(iterations):
+        service.settings.curTVmode, service.settings.newTVmode = (0, 2) if i % 2 == 0 else (2, 0)
+        if not service.session.open(): continue
+        instructions = service.settings.modeGraph.compile(service.settings.curTVmode, service.settings.newTVmode)
+        keysExpected += sum(1 for x in instructions if x[0] == 'KEY')
+        slept = xbmc.clock.slept
+        start = time.perf_counter()
+        service.processSequence(instructions)
+        sent.append(time.perf_counter() - start)
+        waitForAcks(service)
+        acked.append(time.perf_counter() - start)
+        waited.append(xbmc.clock.slept - slept)
+    result = {'sent': summary(sent), 'acked': summary(acked), 'key_delays': summary(waited)}
+    result['keys_expected'] = keysExpected
+    result['keys_received'] = len(tv.keys) - keysBefore
+    result['connections'] = tv.connections
+    result['drops'] = tv.drops
+    return result
+
+def benchPayloads(service, frames = 100000, chunk = 4096):
+    import lib.codec as codec
+    stream = codec.encodeFrame(faketv.appstring, faketv.keyAck) * frames
+    decoder = codec.FrameDecoder()
+    start = time.perf_counter()
+    payloads = 0
+    for offset in range(0, len(stream), chunk):
+        payloads += len(service.getPayloads(stream[offset:offset + chunk], decoder))
+    seconds = time.perf_counter() - start
+    return {'frames': payloads, 'frames_per_sec': int(payloads / seconds), 'mb_per_sec': round(len(stream) / seconds / 1e6, 2)}
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Offline end-to-end benchmark of 3D Enabler')
+    parser.add_argument('--iterations', type = int, default = 10)
+    parser.add_argument('--ack-latency', type = float, default = 20, help = 'key acknowledgement latency of fake TV in ms')
+    parser.add_argument('--auth-latency', type = float, default = 0, help = 'time fake TV takes to grant access in ms')
+    parser.add_argument('--drop-after', type = int, default = 0, help = 'fake TV drops the connection after this many keys')
+    parser.add_argument('--ssdp-delay', type = float, default = 50, help = 'fake SSDP answer delay in ms')
+    parser.add_argument('--debug-logging', action = 'store_true', help = 'run with Kodi debug logging turned on')
+    parser.add_argument('--realtime', action = 'store_true', help = 'really sleep key delays instead of advancing virtual clock')
+    parser.add_argument('--output', help = 'write JSON results to file as well')
+    args = parser.parse_args()
+
+    xbmc.clock.realtime = args.realtime
+    xbmc.kodi['debugLogging'] = args.debug_logging
+    xbmcaddon.profile = tempfile.mkdtemp(prefix = '3denabler-bench-')
+    xbmcaddon.settings.update({'ipaddress': '127.0.0.1', 'tvname': tvName, 'discover': 'true', 'notifications': 'false', 'transport': '1'})
+
+    tv = faketv.FakeTV(ackLatency = args.ack_latency / 1000.0, authLatency = args.auth_latency / 1000.0, dropAfter = args.drop_after)
+    tv.start()
+    descriptionServer = fakessdp.DescriptionServer(friendlyName = tvName, udn = tvUdn)
+    descriptionServer.start()
+    try:
+        responder = fakessdp.SSDPResponder(descriptionServer.location, tvUdn, args.ssdp_delay / 1000.0)
+        responder.start()
+    except (OSError, IOError) as e:
+        responder = None
+        sys.stderr.write('SSDP responder is not available: ' + repr(e) + '\n')
+
+    import service
+    setUp(service)
+    # Fake responder only answers on loopback - TVs on the real network must not skew the timings
+    service.ssdpInterfaces = [fakessdp.loopback]
+    results = {
+        'python': platform.python_version(),
+        'iterations': args.iterations,
+        'ack_latency_ms': args.ack_latency,
+        'realtime': args.realtime,
+        'debug_logging': args.debug_logging
+    }
+    results['discoverTVip'] = benchDiscover(service, max(1, args.iterations // 2)) if responder else None
+    results['connectTV'] = benchConnect(service, args.iterations)
+    results['authenticate'] = benchAuthenticate(service, args.iterations)
+    results['processSequence'] = benchSequence(service, tv, args.iterations)
+    results['getPayloads'] = benchPayloads(service)
+    results['spans'] = service.stats.summary()
+    service.session.close()
+
+    if responder: responder.stop()
+    descriptionServer.stop()
+    tv.stop()
+    output = json.dumps(results, indent = 2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+if __name__ == '__main__':
+    main()
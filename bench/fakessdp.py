@@ -0,0 +1,99 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Fake SSDP responder and UPnP description server for the offline benchmarks.
+# Answers M-SEARCH requests for Samsung device types on loopback after a
+# configurable delay and serves a device description padded to a realistic
+# size. The responder joins the multicast group on loopback only and ignores
+# searches from other hosts, so it never advertises itself on the real network.
+
+import http.server
+import socket
+import struct
+import threading
+import time
+
+multicastGroup  = '239.255.255.250'
+loopback        = '127.0.0.1'
+samsungTypes    = ['urn:samsung.com:device:RemoteControlReceiver:1', 'urn:samsung.com:service:MultiScreenService:1', 'urn:dial-multiscreen-org:device:dialreceiver:1']
+
+def description(friendlyName, modelName, udn, padding):
+    return ('<?xml version="1.0"?><root xmlns="urn:schemas-upnp-org:device-1-0"><specVersion><major>1</major></specVersion>'
+            '<device><deviceType>urn:samsung.com:device:RemoteControlReceiver:1</deviceType><friendlyName>%s</friendlyName>'
+            '<modelName>%s</modelName><UDN>%s</UDN>%s</device></root>' % (friendlyName, modelName, udn, '<iconList/>' * padding)).encode('utf-8')
+
+class DescriptionServer(object):
+    def __init__(self, host = '127.0.0.1', friendlyName = '[TV] Bench', modelName = 'UE00BENCH', udn = 'uuid:bench-tv', padding = 2000):
+        body = description(friendlyName, modelName, udn, padding)
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/xml')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+        self.server = http.server.ThreadingHTTPServer((host, 0), Handler)
+        self.location = 'http://%s:%d/dmr.xml' % (host, self.server.server_address[1])
+        self.thread = threading.Thread(target = self.server.serve_forever, name = 'FakeDescriptionServer')
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class SSDPResponder(threading.Thread):
+    def __init__(self, location, udn = 'uuid:bench-tv', delay = 0.05, port = 1900):
+        threading.Thread.__init__(self, name = 'FakeSSDPResponder')
+        self.daemon     = True
+        self.location   = location
+        self.udn        = udn
+        self.delay      = delay     # seconds before answering, real TVs spread answers over MX
+        self.searches   = 0
+        self.running    = True
+        self.sock       = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((multicastGroup, port))
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(multicastGroup) + socket.inet_aton(loopback))
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(loopback))
+        self.sock.settimeout(0.5)
+
+    def run(self):
+        while self.running:
+            try:
+                data, address = self.sock.recvfrom(2048)
+            except socket.timeout:
+                continue
+            except (socket.error, OSError):
+                break
+            if not data.startswith(b'M-SEARCH') or not address[0].startswith('127.'): continue
+            self.searches += 1
+            for st in samsungTypes:
+                if st.encode('ascii') in data or b'ssdp:all' in data:
+                    time.sleep(self.delay)
+                    self.sock.sendto(('HTTP/1.1 200 OK\r\nCACHE-CONTROL: max-age=1800\r\nEXT:\r\nLOCATION: %s\r\n'
+                        'SERVER: SHP, UPnP/1.0, Samsung UPnP SDK/1.0\r\nST: %s\r\nUSN: %s::%s\r\n\r\n' % (self.location, st, self.udn, st)).encode('ascii'), address)
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
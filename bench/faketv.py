@@ -0,0 +1,103 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Fake Samsung TV for the offline benchmarks.
+# Speaks the legacy remote framing on port 55000: grants authentication and
+# acknowledges every key after a configurable latency. With dropAfter set the
+# TV sends the disconnect payload and closes the connection after that many
+# keys, like real TVs do with idle or stale sessions.
+
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lib.codec as codec
+
+appstring       = b'iphone..iapp.samsung'
+granted         = b'\x64\x00\x01\x00'
+denied          = b'\x64\x00\x00\x00'
+waiting         = b'\x0A\x00\x01\x00\x00\x00'
+disconnected    = b'\x0A\x00\x15\x00\x00\x00'
+keyAck          = b'\x00\x00\x00\x00'
+
+class FakeTV(threading.Thread):
+    def __init__(self, host = '127.0.0.1', port = 55000, ackLatency = 0, authLatency = 0, dropAfter = 0, deny = False):
+        threading.Thread.__init__(self, name = 'FakeTV')
+        self.daemon         = True
+        self.ackLatency     = ackLatency    # seconds before a key is acknowledged
+        self.authLatency    = authLatency   # seconds the user takes to allow access
+        self.dropAfter      = dropAfter     # keys per connection before TV drops it, 0 - never
+        self.deny           = deny
+        self.keys           = []
+        self.connections    = 0
+        self.drops          = 0
+        self.running        = True
+        self.server         = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(5)
+
+    def run(self):
+        while self.running:
+            try:
+                conn = self.server.accept()[0]
+            except (socket.error, OSError):
+                break
+            self.connections += 1
+            handler = threading.Thread(target = self.serve, args = (conn,), name = 'FakeTVConnection')
+            handler.daemon = True
+            handler.start()
+
+    def serve(self, conn):
+        decoder = codec.FrameDecoder()
+        keys = 0
+        try:
+            while self.running:
+                data = conn.recv(4096)
+                if not data: break
+                for payload in decoder.feed(data):
+                    if payload[:1] == b'\x64':
+                        # Authentication request
+                        if self.authLatency:
+                            conn.sendall(codec.encodeFrame(appstring, waiting))
+                            time.sleep(self.authLatency)
+                        conn.sendall(codec.encodeFrame(appstring, denied if self.deny else granted))
+                        continue
+                    if self.dropAfter and keys >= self.dropAfter:
+                        self.drops += 1
+                        conn.sendall(codec.encodeFrame(appstring, disconnected))
+                        return
+                    if self.ackLatency: time.sleep(self.ackLatency)
+                    keys += 1
+                    self.keys.append(payload)
+                    conn.sendall(codec.encodeFrame(appstring, keyAck))
+        except (socket.error, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.running = False
+        try:
+            self.server.close()
+        except (socket.error, OSError):
+            pass
@@ -0,0 +1,362 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Deterministic replay of a protocol trace recorded by the service (trace.bin in
+# the addon profile). A replay TV answers every frame the service sends with the
+# bytes the real TV sent back, split and delayed exactly as recorded, and a
+# replay SSDP responder repeats the recorded M-SEARCH answers. The service code
+# paths getPayloads(), authenticate(), processSequence() and discoverTVip() are
+# then timed against them and compared with the recorded timings.
+# Description XML is not part of a trace - LOCATION is pointed to a local
+# description server instead.
+# Usage: python bench/replay.py TRACE [--speed X] [--iterations N] [--output FILE]
+# --speed 2 replays twice as fast, --speed 0 without any recorded delays.
+
+import argparse
+import base64
+import json
+import os
+import platform
+import re
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(benchDir, 'stubs'), benchDir, os.path.dirname(benchDir)]
+
+import xbmc
+import xbmcaddon
+import fakessdp
+import lib.codec as codec
+import lib.trace as trace
+from bench_service import setUp, summary, timed, waitForAcks
+
+def decodeKey(payload):
+    # Key payload: 3 zero bytes | uint16 LE length | base64 key name
+    if payload[:3] != b'\x00\x00\x00' or len(payload) < 5: return None
+    try:
+        return base64.b64decode(payload[5:5 + struct.unpack('<H', payload[3:5])[0]]).decode('utf-8')
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+class Session(object):
+    '''One recorded connection to port 55000 turned into a script for the replay TV'''
+    def __init__(self, stream):
+        self.stream     = stream
+        self.script     = []        # ('expect', frames) | ('reply', delay, data) | ('close', delay)
+        self.received   = []        # (time, data) of everything the TV sent - chunked as recorded
+        self.auth       = False
+        self.keys       = []        # (time, key name)
+        self.authTime   = None      # recorded seconds from auth request to TV answer
+        self.ackTime    = None      # recorded seconds from first key to last acknowledgement
+
+    def build(self, records):
+        sent = codec.FrameDecoder()
+        received = codec.FrameDecoder()
+        last = None
+        authAt = firstKeyAt = None
+        for record in records:
+            if record.event == trace.SEND:
+                frames = 0
+                for payload in sent.feed(record.data):
+                    frames += 1
+                    if payload[:1] == b'\x64':
+                        self.auth = True
+                        authAt = record.time
+                    key = decodeKey(payload)
+                    if key:
+                        self.keys.append((record.time, key))
+                        if firstKeyAt is None: firstKeyAt = record.time
+                if not frames: continue
+                if self.script and self.script[-1][0] == 'expect':
+                    self.script[-1] = ('expect', self.script[-1][1] + frames)
+                else:
+                    self.script.append(('expect', frames))
+                last = record.time
+            elif record.event == trace.RECV:
+                delay = record.time - last if last is not None else 0
+                last = record.time
+                if not record.data:
+                    self.script.append(('close', delay))
+                    continue
+                self.script.append(('reply', delay, record.data))
+                self.received.append((record.time, record.data))
+                for payload in received.feed(record.data):
+                    if payload[:1] == b'\x64' and authAt is not None and self.authTime is None:
+                        self.authTime = record.time - authAt
+                if firstKeyAt is not None:
+                    self.ackTime = record.time - firstKeyAt
+
+    def instructions(self, appstring, speed):
+        # Recorded keys with the recorded gaps between writes as WAIT steps
+        instructions = []
+        previous = None
+        for sentAt, key in self.keys:
+            if previous is not None and sentAt > previous:
+                wait = (sentAt - previous) * 1000
+                instructions.append(('WAIT', int(wait / speed) if speed else 0))
+            instructions.append(('KEY', key, codec.encodeKey(appstring, key)))
+            previous = sentAt
+        return instructions
+
+def loadTrace(path):
+    streams = {}
+    searches = []       # list of [responses] - responses are (delay, datagram)
+    searchStart = None
+    lastEvent = None
+    count = 0
+    duration = 0
+    for record in trace.readTrace(path):
+        count += 1
+        duration = record.time
+        if record.event == trace.SSDP_SEND:
+            # Burst of M-SEARCH datagrams starts a new search
+            if lastEvent != trace.SSDP_SEND:
+                searches.append([])
+                searchStart = record.time
+        elif record.event == trace.SSDP_RECV:
+            if searches: searches[-1].append((record.time - searchStart, record.data))
+        else:
+            streams.setdefault(record.stream, []).append(record)
+        lastEvent = record.event
+    sessions = []
+    for stream in sorted(streams):
+        session = Session(stream)
+        session.build(streams[stream])
+        sessions.append(session)
+    return {'records': count, 'duration': duration, 'sessions': sessions, 'searches': searches}
+
+class ReplayTV(threading.Thread):
+    '''Serves recorded sessions in order, one per accepted connection'''
+    def __init__(self, sessions, speed = 1.0, host = '127.0.0.1', port = 55000):
+        threading.Thread.__init__(self, name = 'ReplayTV')
+        self.daemon     = True
+        self.sessions   = sessions
+        self.speed      = speed
+        self.connections = 0
+        self.running    = True
+        self.server     = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(5)
+
+    def run(self):
+        while self.running:
+            try:
+                conn = self.server.accept()[0]
+            except (socket.error, OSError):
+                break
+            session = self.sessions[self.connections % len(self.sessions)]
+            self.connections += 1
+            handler = threading.Thread(target = self.serve, args = (conn, session), name = 'ReplayTVConnection')
+            handler.daemon = True
+            handler.start()
+
+    def pause(self, seconds):
+        if self.speed and seconds > 0: time.sleep(seconds / self.speed)
+
+    def serve(self, conn, session):
+        decoder = codec.FrameDecoder()
+        received = 0
+        expected = 0
+        try:
+            for step in session.script:
+                if step[0] == 'expect':
+                    expected += step[1]
+                    while received < expected:
+                        data = conn.recv(4096)
+                        if not data: return
+                        received += len(decoder.feed(data))
+                elif step[0] == 'reply':
+                    self.pause(step[1])
+                    conn.sendall(step[2])
+                elif step[0] == 'close':
+                    self.pause(step[1])
+                    return
+            # Script is over - stay silent until the service hangs up
+            while self.running and conn.recv(4096):
+                pass
+        except (socket.error, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.running = False
+        try:
+            self.server.close()
+        except (socket.error, OSError):
+            pass
+
+class ReplaySSDP(fakessdp.SSDPResponder):
+    '''Answers the first M-SEARCH after arm() with the responses of one recorded search'''
+    def __init__(self, location, speed = 1.0):
+        fakessdp.SSDPResponder.__init__(self, location)
+        self.speed      = speed
+        self.responses  = None
+        self.locations  = {}    # recorded location -> local one
+
+    def arm(self, responses):
+        self.responses = responses
+
+    def localize(self, datagram):
+        def replace(match):
+            location = match.group(2).decode('utf-8', 'replace')
+            if location not in self.locations:
+                self.locations[location] = self.location.replace('/dmr.xml', '/%d/dmr.xml' % len(self.locations))
+            return match.group(1) + self.locations[location].encode('utf-8')
+        return re.sub(b'(?im)^(location:[ \t]*)(\\S+)', replace, datagram)
+
+    def run(self):
+        while self.running:
+            try:
+                data, address = self.sock.recvfrom(2048)
+            except socket.timeout:
+                continue
+            except (socket.error, OSError):
+                break
+            if not data.startswith(b'M-SEARCH') or not address[0].startswith('127.') or self.responses is None: continue
+            self.searches += 1
+            responses, self.responses = self.responses, None
+            started = time.monotonic()
+            for delay, datagram in responses:
+                if self.speed:
+                    time.sleep(max(0, started + delay / self.speed - time.monotonic()))
+                self.sock.sendto(self.localize(datagram), address)
+
+def replayDiscover(service, responder, searches, iterations):
+    samples = []
+    found = 0
+    for _ in range(iterations):
+        for responses in searches:
+            responder.arm(responses)
+            tv, seconds = timed(service.discoverTVip)
+            samples.append(seconds)
+            if tv: found += 1
+    result = summary(samples)
+    result['found'] = found
+    return result
+
+def replaySessions(service, sessions, speed, iterations):
+    auth, sent, acked = [], [], []
+    granted = 0
+    appstring = service.settings.appstring.encode('utf-8')
+    for _ in range(iterations):
+        for session in sessions:
+            if not service.connectTV(False): continue
+            if session.auth:
+                ok, seconds = timed(service.authenticate)
+                auth.append(seconds)
+                if not ok:
+                    service.session.close()
+                    continue
+                granted += 1
+            service.session.ready()
+            if session.keys:
+                start = time.perf_counter()
+                service.processSequence(session.instructions(appstring, speed))
+                sent.append(time.perf_counter() - start)
+                waitForAcks(service)
+                acked.append(time.perf_counter() - start)
+            service.session.close()
+    recordedAuth = [x.authTime for x in sessions if x.authTime is not None]
+    recordedAcked = [x.ackTime for x in sessions if x.ackTime is not None]
+    return {
+        'authenticate': summary(auth),
+        'granted': granted,
+        'sent': summary(sent),
+        'acked': summary(acked),
+        'recorded': {'authenticate': summary(recordedAuth), 'acked': summary(recordedAcked)}
+    }
+
+def replayPayloads(service, sessions, iterations):
+    # Recorded TV bytes in their original chunks through the streaming decoder
+    payloads = 0
+    size = 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for session in sessions:
+            decoder = codec.FrameDecoder()
+            for receivedAt, data in session.received:
+                payloads += len(service.getPayloads(data, decoder))
+                size += len(data)
+    seconds = max(time.perf_counter() - start, 1e-9)
+    return {'frames': payloads, 'frames_per_sec': int(payloads / seconds), 'mb_per_sec': round(size / seconds / 1e6, 2)}
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Replay a 3D Enabler protocol trace against the service')
+    parser.add_argument('trace', help = 'trace.bin from the addon profile')
+    parser.add_argument('--speed', type = float, default = 1.0, help = 'replay speed, 0 - no recorded delays')
+    parser.add_argument('--iterations', type = int, default = 1)
+    parser.add_argument('--debug-logging', action = 'store_true', help = 'run with Kodi debug logging turned on')
+    parser.add_argument('--output', help = 'write JSON results to file as well')
+    args = parser.parse_args()
+
+    recorded = loadTrace(args.trace)
+    # Recorded key delays are part of the replayed WAIT steps, so sleeps are real unless speed is 0
+    xbmc.clock.realtime = bool(args.speed)
+    xbmc.kodi['debugLogging'] = args.debug_logging
+    xbmcaddon.profile = tempfile.mkdtemp(prefix = '3denabler-replay-')
+    xbmcaddon.settings.update({'ipaddress': '127.0.0.1', 'discover': 'true', 'notifications': 'false', 'transport': '1'})
+
+    tv = ReplayTV(recorded['sessions'], args.speed) if recorded['sessions'] else None
+    if tv: tv.start()
+    descriptionServer = None
+    responder = None
+    if recorded['searches']:
+        descriptionServer = fakessdp.DescriptionServer()
+        descriptionServer.start()
+        try:
+            responder = ReplaySSDP(descriptionServer.location, args.speed)
+            responder.start()
+        except (OSError, IOError) as e:
+            sys.stderr.write('SSDP responder is not available: ' + repr(e) + '\n')
+
+    import service
+    setUp(service)
+    # Fake responder only answers on loopback - TVs on the real network must not skew the timings
+    service.ssdpInterfaces = [fakessdp.loopback]
+    results = {
+        'python': platform.python_version(),
+        'trace': os.path.basename(args.trace),
+        'records': recorded['records'],
+        'duration_s': round(recorded['duration'], 3),
+        'speed': args.speed,
+        'iterations': args.iterations
+    }
+    results['discoverTVip'] = replayDiscover(service, responder, recorded['searches'], args.iterations) if responder else None
+    results['sessions'] = replaySessions(service, recorded['sessions'], args.speed, args.iterations) if tv else None
+    results['getPayloads'] = replayPayloads(service, recorded['sessions'], max(1, args.iterations) * 100)
+    results['spans'] = service.stats.summary()
+    service.session.close()
+
+    if responder: responder.stop()
+    if descriptionServer: descriptionServer.stop()
+    if tv: tv.stop()
+    output = json.dumps(results, indent = 2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Minimal stand-in for Kodi's xbmc module used by the offline benchmarks.
+# Sleeps go through a scriptable clock that only advances virtual time unless
+# realtime is enabled, JSON-RPC answers come from the scriptable kodi dict and
+# Monitor instances receive notifications fired with notify().
+
+import json
+import time
+
+LOGDEBUG    = 0
+LOGINFO     = 1
+LOGWARNING  = 2
+LOGERROR    = 3
+LOGFATAL    = 4
+
+logLevel        = LOGWARNING    # messages below this level are only counted
+logged          = []
+logCount        = 0
+builtins        = []            # executebuiltin() calls, e.g. notifications
+monitors        = []
+aborted         = False
+
+# Scriptable Kodi state
+kodi = {
+    'stereoscopicmode'  : 'off',
+    'hasVideo'          : False,
+    'paused'            : False,
+    'playingFile'       : '',
+    'idleTime'          : 0,
+    'debugLogging'      : False
+}
+
+class Clock(object):
+    def __init__(self):
+        self.realtime   = False
+        self.slept      = 0.0   # seconds spent in sleeps, virtual or real
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        if self.realtime: time.sleep(seconds)
+
+    def reset(self):
+        self.slept = 0.0
+
+clock = Clock()
+
+def log(msg, level = LOGDEBUG):
+    global logCount
+    logCount += 1
+    if level >= logLevel: logged.append(msg)
+
+def sleep(ms):
+    clock.sleep(ms / 1000.0)
+
+def executebuiltin(command, wait = False):
+    builtins.append(command)
+
+def getCondVisibility(condition):
+    if condition == 'Player.Paused': return kodi['paused']
+    if condition == 'System.GetBool(debug.showloginfo)': return kodi['debugLogging']
+    return False
+
+def getInfoLabel(label):
+    return ''
+
+def getGlobalIdleTime():
+    return kodi['idleTime']
+
+def executeJSONRPC(query):
+    request = json.loads(query)
+    if isinstance(request, list):
+        return json.dumps([answer(x) for x in request])
+    return json.dumps(answer(request))
+
+def answer(request):
+    method = request.get('method')
+    if method == 'GUI.GetProperties':
+        result = {'stereoscopicmode': {'mode': kodi['stereoscopicmode'], 'label': ''}}
+    elif method == 'XBMC.GetInfoBooleans':
+        result = {'Player.HasVideo': kodi['hasVideo'], 'Player.Paused': kodi['paused']}
+    else:
+        return {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'code': -32601, 'message': 'Method not found.'}}
+    return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': result}
+
+def notify(sender, method, data = ''):
+    for monitor in monitors:
+        monitor.onNotification(sender, method, data)
+
+class Player(object):
+    def isPlayingVideo(self):
+        return kodi['hasVideo']
+
+    def getPlayingFile(self):
+        if not kodi['hasVideo']: raise RuntimeError('Kodi is not playing any media file')
+        return kodi['playingFile']
+
+    def pause(self):
+        kodi['paused'] = not kodi['paused']
+
+class Monitor(object):
+    def __init__(self):
+        monitors.append(self)
+
+    def abortRequested(self):
+        return aborted
+
+    def waitForAbort(self, timeout = 0):
+        clock.sleep(timeout or 0)
+        return aborted
+
+    def onSettingsChanged(self):
+        pass
+
+    def onNotification(self, sender, method, data):
+        pass
@@ -0,0 +1,55 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Minimal stand-in for Kodi's xbmcaddon module used by the offline benchmarks.
+# Setting defaults are read from resources/settings.xml of the addon and can be
+# overridden through the settings dict. profile is the addon data directory.
+
+import os
+import xml.etree.ElementTree as ElementTree
+
+addonDir    = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+profile     = os.path.join(addonDir, 'bench', 'profile')
+
+def loadDefaults():
+    defaults = {}
+    for setting in ElementTree.parse(os.path.join(addonDir, 'resources', 'settings.xml')).iter('setting'):
+        if setting.get('id'):
+            defaults[setting.get('id')] = setting.get('default', '')
+    return defaults
+
+settings = loadDefaults()
+
+class Addon(object):
+    def __init__(self, id = None):
+        pass
+
+    def getAddonInfo(self, name):
+        return {'name': '3D Enabler', 'id': 'service.3denabler.samsungtv', 'icon': '', 'path': addonDir, 'profile': profile}.get(name, '')
+
+    def getSetting(self, name):
+        return settings.get(name, '')
+
+    def setSetting(self, name, value):
+        settings[name] = value
+
+    def getLocalizedString(self, stringId):
+        return str(stringId)
+
+    def openSettings(self):
+        pass
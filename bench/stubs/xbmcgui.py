@@ -0,0 +1,67 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Minimal stand-in for Kodi's xbmcgui module used by the offline benchmarks.
+# Dialog answers are scriptable through the answers dict.
+
+answers = {
+    'select'    : 0,
+    'yesno'     : False,
+    'numeric'   : None      # None returns the default value
+}
+
+shown = []     # texts shown by textviewer()
+
+class Dialog(object):
+    def select(self, heading, options, *args, **kwargs):
+        return answers['select']
+
+    def yesno(self, heading, *args, **kwargs):
+        return answers['yesno']
+
+    def numeric(self, type, heading, default = ''):
+        return default if answers['numeric'] is None else answers['numeric']
+
+    def ok(self, heading, *args, **kwargs):
+        return True
+
+    def textviewer(self, heading, text, *args, **kwargs):
+        shown.append((heading, text))
+
+class DialogProgress(object):
+    def create(self, heading, message = ''):
+        pass
+
+    def update(self, percent, message = ''):
+        pass
+
+    def iscanceled(self):
+        return False
+
+    def close(self):
+        pass
+
+class Window(object):
+    def __init__(self, windowId = -1):
+        self.visible = False
+
+    def show(self):
+        self.visible = True
+
+    def close(self):
+        self.visible = False
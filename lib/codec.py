@@ -0,0 +1,76 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Frame codec for the legacy Samsung remote protocol on port 55000.
+# Every frame is:
+#   0x00 | uint16 LE length | app string | uint16 LE length | payload
+# Auth and key payloads are built from base64 strings prefixed with uint16 LE lengths.
+
+import base64
+import struct
+
+_u16 = struct.Struct('<H')
+_header = struct.Struct('<BH')
+
+def lengthPrefixed(data):
+    return _u16.pack(len(data)) + data
+
+def encodeFrame(appstring, payload):
+    return b''.join((_header.pack(0, len(appstring)), appstring, _u16.pack(len(payload)), payload))
+
+def encodeKey(appstring, key):
+    key64 = base64.b64encode(key.encode('utf-8'))
+    return encodeFrame(appstring, b''.join((b'\x00\x00\x00', _u16.pack(len(key64)), key64)))
+
+def encodeAuth(appstring, ip, mac, remotename):
+    fields = [lengthPrefixed(base64.b64encode(value.encode('utf-8'))) for value in (ip, mac, remotename)]
+    return encodeFrame(appstring, b'\x64\x00' + b''.join(fields))
+
+class FrameDecoder(object):
+    '''Streaming decoder - keeps incomplete frames buffered between reads'''
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+        payloads = []
+        view = memoryview(self.buffer)
+        size = len(view)
+        offset = 0
+        while size - offset >= 3:
+            strLen = _u16.unpack_from(view, offset + 1)[0]
+            paylStart = offset + 5 + strLen
+            if size < paylStart: break
+            paylLen = _u16.unpack_from(view, paylStart - 2)[0]
+            if size < paylStart + paylLen: break
+            payloads.append(bytes(view[paylStart:paylStart + paylLen]))
+            offset = paylStart + paylLen
+        view.release()
+        if offset:
+            del self.buffer[:offset]
+        return payloads
+
+    def pending(self):
+        return len(self.buffer)
+
+    def reset(self):
+        del self.buffer[:]
+
+def decodeFrames(data):
+    # One-shot decode of complete frames
+    return FrameDecoder().feed(data)
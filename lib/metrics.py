@@ -0,0 +1,97 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Hot path timing metrics.
+# Spans are measured with the monotonic clock and kept in rolling histograms
+# per name. Summaries (count, p50, p95, max in ms) are written to a stats file
+# in the addon profile, where script.py can show them.
+
+import collections
+import json
+import threading
+import time
+import lib.storage as storage
+
+class Histogram(object):
+    def __init__(self, window = 200):
+        self.samples    = collections.deque(maxlen = window)  # recent durations in ms
+        self.count      = 0
+
+    def add(self, ms):
+        self.samples.append(ms)
+        self.count += 1
+
+    def summary(self):
+        samples = sorted(self.samples)
+        if not samples: return {'count': self.count}
+        return {
+            'count' : self.count,
+            'p50'   : round(samples[len(samples) // 2], 1),
+            'p95'   : round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 1),
+            'max'   : round(samples[-1], 1)
+        }
+
+class Span(object):
+    def __init__(self, metrics, name):
+        self.metrics    = metrics
+        self.name       = name
+        self.start      = 0
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        # Only completed operations are timed - failures would skew the histogram
+        if excType is None:
+            self.metrics.record(self.name, time.monotonic() - self.start)
+        return False
+
+class Metrics(object):
+    def __init__(self, path = None, window = 200):
+        self.path       = path
+        self.window     = window
+        self.histograms = {}
+        self.counters   = {}
+        self.lock       = threading.Lock()
+
+    def span(self, name):
+        return Span(self, name)
+
+    def record(self, name, seconds):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(self.window)
+            self.histograms[name].add(seconds * 1000)
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def summary(self):
+        with self.lock:
+            return dict((name, histogram.summary()) for name, histogram in self.histograms.items())
+
+    def save(self):
+        if not self.path: return
+        with self.lock:
+            counters = dict(self.counters)
+        storage.writeFile(self.path, json.dumps({'updated': int(time.time()), 'spans': self.summary(), 'counters': counters}, sort_keys = True))
+
+def loadStats(path):
+    return storage.loadJSON(path)
@@ -0,0 +1,121 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Key transmit pipeline for the legacy port 55000 remote protocol.
+# Key frames are written without waiting for the TV to reply; a background
+# reader collects the acknowledgements and matches them to sent keys in order.
+
+import collections
+import select
+import socket
+import threading
+import time
+
+class KeyPipeline(object):
+    def __init__(self, sock, parsePayloads, disconnected, onAck = None, ackTimeout = 10):
+        self.sock           = sock
+        self.parsePayloads  = parsePayloads     # bytes -> list of payloads
+        self.disconnected   = disconnected      # payload TV sends when it drops the session
+        self.onAck          = onAck             # callback(key, seconds) - seconds is None for lost keys
+        self.ackTimeout     = ackTimeout
+        self.pending        = collections.deque()
+        self.lock           = threading.Lock()
+        self.drained        = threading.Condition(self.lock)  # notified when no key is waiting for its ack
+        self.alive          = True
+        self.running        = True
+        try:
+            # Key frames are tiny - do not let Nagle hold them back
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except socket.error:
+            pass
+        self.reader = threading.Thread(target=self._read, name='3DEnablerAckReader')
+        self.reader.daemon = True
+        self.reader.start()
+
+    def send(self, frames):
+        # frames: list of (key, frame bytes). Consecutive frames are coalesced into a single write
+        if not self.alive: return False
+        data = b''.join(frame for key, frame in frames)
+        with self.lock:
+            now = time.monotonic()
+            for key, frame in frames:
+                self.pending.append((key, now))
+            try:
+                self.sock.sendall(data)
+            except socket.error:
+                for _ in frames:
+                    self.pending.pop()
+                self.alive = False
+                return False
+        return True
+
+    def unacked(self):
+        with self.lock:
+            return len(self.pending)
+
+    def waitForAcks(self, timeout):
+        # True once every key sent so far has been acknowledged
+        deadline = time.monotonic() + timeout
+        with self.drained:
+            while self.pending and self.alive:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: break
+                # Wake up regularly - the reader does not notify when the connection dies
+                self.drained.wait(min(remaining, 0.5))
+            return not self.pending
+
+    def _ack(self, payload):
+        with self.lock:
+            if not self.pending: return
+            key, sentAt = self.pending.popleft()
+            if not self.pending: self.drained.notify_all()
+        if self.onAck: self.onAck(key, time.monotonic() - sentAt)
+
+    def _expire(self):
+        lost = []
+        with self.lock:
+            now = time.monotonic()
+            while self.pending and now - self.pending[0][1] > self.ackTimeout:
+                lost.append(self.pending.popleft()[0])
+        if self.onAck:
+            for key in lost:
+                self.onAck(key, None)
+
+    def _read(self):
+        while self.running and self.alive:
+            try:
+                ready = select.select([self.sock], [], [], 0.5)[0]
+                if ready:
+                    response = self.sock.recv(4096)
+                    if not response:
+                        self.alive = False
+                        break
+                    for payload in self.parsePayloads(response):
+                        if payload == self.disconnected:
+                            self.alive = False
+                            break
+                        self._ack(payload)
+            except (socket.error, ValueError):
+                self.alive = False
+                break
+            self._expire()
+
+    def stop(self):
+        self.running = False
+        if self.reader.is_alive() and self.reader is not threading.current_thread():
+            self.reader.join(1)
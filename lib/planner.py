@@ -0,0 +1,109 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Key planner for the TV 3D menu.
+# 3D modes are nodes of a small graph, key sequences are edges weighted by the
+# time they take. The cheapest path between two modes is compiled into a flat
+# instruction list:
+#   ('KEY', 'KEY_RIGHT')    send key (compiled sequences also carry the encoded frame)
+#   ('WAIT', 1200)          wait milliseconds
+#   ('PAUSE',) ('PLAY',) ('BLACKON',) ('BLACKOFF',)
+#   ('MODE', 2)             TV has settled in mode - safe boundary
+#   ('END',)                start of the closing part of a switch
+#   ('UNKNOWN', 'XYZ')      command that could not be parsed
+
+import heapq
+
+keyCostMs   = 100   # rough cost of sending one key and TV reacting to it
+commands    = ['PAUSE', 'PLAY', 'BLACKON', 'BLACKOFF']
+
+def parseSequence(sequence, keyMap):
+    instructions = []
+    for x in sequence.split(','):
+        thisKey = x.strip().upper()
+        if not thisKey: continue
+        if thisKey in keyMap:
+            instructions.append(('KEY', keyMap[thisKey]))
+        elif thisKey[:3] == 'KEY':
+            instructions.append(('KEY', thisKey))
+        elif thisKey in commands:
+            instructions.append((thisKey,))
+        elif thisKey[:1] == 'P' and thisKey[1:].isdigit():
+            instructions.append(('WAIT', int(thisKey[1:])))
+        else:
+            instructions.append(('UNKNOWN', thisKey))
+    return instructions
+
+def compileSequence(sequence, keyMap, encodeKey):
+    # Parse and validate once. Keys carry their pre-encoded frame, invalid commands are returned separately
+    instructions = []
+    errors = []
+    for instruction in parseSequence(sequence, keyMap):
+        if instruction[0] == 'KEY':
+            instruction = ('KEY', instruction[1], encodeKey(instruction[1]))
+        elif instruction[0] == 'UNKNOWN':
+            errors.append(instruction[1])
+            continue
+        instructions.append(instruction)
+    return tuple(instructions), errors
+
+def sequenceCost(instructions):
+    cost = 0
+    for instruction in instructions:
+        if instruction[0] == 'KEY': cost += keyCostMs
+        elif instruction[0] == 'WAIT': cost += instruction[1]
+    return cost
+
+class ModeGraph(object):
+    def __init__(self, begin = (), end = ()):
+        self.edges      = {}    # mode -> list of (cost, mode, instructions)
+        self.begin      = tuple(begin)
+        self.end        = tuple(end)
+        self.compiled   = {}    # (src, dst) -> instructions
+
+    def addEdge(self, src, dst, instructions):
+        self.edges.setdefault(src, []).append((sequenceCost(instructions), dst, instructions))
+        self.compiled = {}
+
+    def plan(self, src, dst):
+        # Dijkstra over a handful of nodes. Returns list of (mode, instructions) hops or None
+        queue = [(0, src, [])]
+        visited = set()
+        while queue:
+            cost, mode, path = heapq.heappop(queue)
+            if mode == dst: return path
+            if mode in visited: continue
+            visited.add(mode)
+            for edgeCost, nextMode, instructions in self.edges.get(mode, []):
+                if nextMode not in visited:
+                    heapq.heappush(queue, (cost + edgeCost, nextMode, path + [(nextMode, instructions)]))
+        return None
+
+    def compile(self, src, dst):
+        # Instruction list for the whole switch including opening and closing steps
+        if (src, dst) in self.compiled: return self.compiled[(src, dst)]
+        path = self.plan(src, dst)
+        if path is None: return None
+        instructions = list(self.begin)
+        for mode, hop in path:
+            instructions.extend(hop)
+            instructions.append(('MODE', mode))
+        instructions.append(('END',))
+        instructions.extend(self.end)
+        self.compiled[(src, dst)] = tuple(instructions)
+        return self.compiled[(src, dst)]
@@ -0,0 +1,110 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# TV reachability tracker.
+# The remote control ports are probed with non-blocking connects on a background
+# schedule. While the TV is offline probes back off exponentially, so callers
+# can skip connecting altogether and get notified once the TV is back.
+
+import errno
+import select
+import socket
+import threading
+import time
+
+UNKNOWN = 'unknown'
+ONLINE  = 'online'
+OFFLINE = 'offline'
+
+inProgress = (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, 10035)  # 10035 - WSAEWOULDBLOCK
+
+def probe(ip, port, timeout=1):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        if sock.connect_ex((ip, port)) not in inProgress: return False
+        writable, errored = select.select([], [sock], [sock], timeout)[1:]
+        if not writable or errored: return False
+        return sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+    except (socket.error, OSError):
+        return False
+    finally:
+        sock.close()
+
+class ReachabilityTracker(threading.Thread):
+    def __init__(self, target, ports=(55000,), onOnline=None, minBackoff=5, maxBackoff=300, onlineInterval=60, probeTimeout=1):
+        threading.Thread.__init__(self, name='3DEnablerReachability')
+        self.daemon         = True
+        self.target         = target        # callable returning IP address to probe
+        self.ports          = ports         # TV is online if any of them accepts connections
+        self.onOnline       = onOnline      # called on the tracker thread when TV comes back
+        self.minBackoff     = minBackoff
+        self.maxBackoff     = maxBackoff
+        self.onlineInterval = onlineInterval
+        self.probeTimeout   = probeTimeout
+        self.state          = UNKNOWN
+        self.backoff        = minBackoff
+        self.lastSeen       = 0
+        self.nextProbe      = 0
+        self.wakeup         = threading.Event()
+        self.running        = True
+
+    def isOffline(self):
+        return self.state == OFFLINE
+
+    def poke(self):
+        # Probe as soon as possible - e.g. playback has started or TV has announced itself
+        self.nextProbe = 0
+        self.wakeup.set()
+
+    def markOnline(self):
+        wasOffline = self.state == OFFLINE
+        self.state = ONLINE
+        self.backoff = self.minBackoff
+        self.lastSeen = time.monotonic()
+        self.nextProbe = self.lastSeen + self.onlineInterval
+        if wasOffline and self.onOnline: self.onOnline()
+
+    def markOffline(self):
+        if self.state != OFFLINE:
+            self.backoff = self.minBackoff
+        else:
+            self.backoff = min(self.maxBackoff, self.backoff * 2)
+        self.state = OFFLINE
+        self.nextProbe = time.monotonic() + self.backoff
+
+    def run(self):
+        while self.running:
+            self.wakeup.wait(max(0, self.nextProbe - time.monotonic()))
+            self.wakeup.clear()
+            if not self.running: break
+            if time.monotonic() < self.nextProbe: continue
+            ip = self.target()
+            if not ip:
+                self.state = UNKNOWN
+                self.nextProbe = time.monotonic() + self.maxBackoff
+            elif any(probe(ip, port, self.probeTimeout) for port in self.ports):
+                self.markOnline()
+            else:
+                self.markOffline()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.is_alive():
+            self.join(2)
@@ -0,0 +1,88 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Persistent registry of discovered TVs keyed by UDN.
+# Entries are refreshed by discovery and by SSDP NOTIFY announcements, so the
+# current address of a known TV can be resolved without an active search.
+
+import json
+import threading
+import time
+import lib.storage as storage
+
+def udnFromUsn(usn):
+    # uuid:xxxx::urn:samsung.com:device:RemoteControlReceiver:1 -> uuid:xxxx
+    return (usn or '').split('::', 1)[0]
+
+def maxAgeFromCache(cache, default=1800):
+    try:
+        return int(str(cache).split('=')[-1])
+    except ValueError:
+        return default
+
+class DeviceRegistry(object):
+    def __init__(self, path):
+        self.path       = path
+        self.devices    = {}
+        self.lock       = threading.Lock()
+        self.load()
+
+    def load(self):
+        self.devices = storage.loadJSON(self.path, {})
+
+    def save(self):
+        with self.lock:
+            data = json.dumps(self.devices)
+        storage.writeFile(self.path, data)
+
+    def update(self, udn, **fields):
+        # Returns True if address or presence of the device has changed
+        if not udn: return False
+        with self.lock:
+            device = self.devices.setdefault(udn, {})
+            changed = device.get('ip') != fields.get('ip', device.get('ip')) or not device.get('alive', False)
+            device.update((k, v) for k, v in fields.items() if v is not None)
+            device['alive'] = True
+            device['lastSeen'] = time.time()
+            device.setdefault('maxAge', 1800)
+            return changed
+
+    def byebye(self, udn):
+        with self.lock:
+            if udn in self.devices and self.devices[udn].get('alive', False):
+                self.devices[udn]['alive'] = False
+                return True
+        return False
+
+    def get(self, udn):
+        with self.lock:
+            return dict(self.devices.get(udn, {}))
+
+    def findByName(self, name):
+        with self.lock:
+            for udn, device in self.devices.items():
+                if name and device.get('name') == name:
+                    return udn
+        return None
+
+    def resolve(self, udn):
+        # Current IP address if the device has announced itself recently enough
+        device = self.get(udn)
+        if not device or not device.get('alive', False): return None
+        if time.time() - device.get('lastSeen', 0) > device.get('maxAge', 1800): return None
+        return device.get('ip')
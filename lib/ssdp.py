@@ -13,31 +13,70 @@
 #   limitations under the License.
 
 import socket
-import http.client
-import io
-import json
-
-class SSDPResponse(object):
-    class _FakeSocket(io.BytesIO):
-        def makefile(self, *args, **kw):
-            return self
-    def __init__(self, response):
-        r = http.client.HTTPResponse(self._FakeSocket(response))
-        try:
-            r.begin()
-            self.location = r.getheader("location")
-            self.usn = r.getheader("usn")
-            self.st = r.getheader("st")
-            self.cache = r.getheader("cache-control").split("=")[1]
-        except Exception as e:
-            print(str(e))
-
-    def toJson(self):
-        return json.dumps(self, default=lambda o: o.__dict__)
-    def __repr__(self):
-        return "<SSDPResponse({location}, {st}, {usn})>".format(**self.__dict__)
+import select
+import struct
+import threading
+import time
+import collections
+import selectors
 
-def discover(service, timeout=5, retries=1, mx=3):
+# Compact record of an M-SEARCH response - no HTTP machinery, no JSON round trip
+SSDPRecord = collections.namedtuple('SSDPRecord', ['location', 'usn', 'st', 'cache', 'server', 'interface'])
+
+def parseResponse(datagram, interface=None):
+    # Parse M-SEARCH response headers straight from bytes. Returns None if it is not a usable response
+    head = datagram.split(b'\r\n\r\n', 1)[0]
+    lines = head.split(b'\r\n')
+    if not lines[0].startswith(b'HTTP/'): return None
+    location = usn = st = server = None
+    cache = ''
+    for line in lines[1:]:
+        name, sep, value = line.partition(b':')
+        if not sep: continue
+        name = name.strip().lower()
+        if name == b'location': location = value.strip().decode('utf-8', 'replace')
+        elif name == b'usn': usn = value.strip().decode('utf-8', 'replace')
+        elif name == b'st': st = value.strip().decode('utf-8', 'replace')
+        elif name == b'server': server = value.strip().decode('utf-8', 'replace')
+        elif name == b'cache-control': cache = value.strip().decode('utf-8', 'replace').split('=')[-1].strip()
+    if not location: return None
+    return SSDPRecord(location, usn, st, cache, server, interface)
+
+def isSamsung(record):
+    return 'samsung' in ' '.join((record.st or '', record.usn or '', record.server or '')).lower()
+
+# Search targets answered by Samsung TVs
+samsungTargets = [
+        'urn:samsung.com:device:RemoteControlReceiver:1',
+        'urn:samsung.com:service:MultiScreenService:1',
+        'urn:dial-multiscreen-org:device:dialreceiver:1'
+    ]
+
+def searchSocket(interface):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+        # Make multicast leave through this interface rather than the default route
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+        sock.bind((interface, 0))  # Bind on any free port on this interface
+        sock.setblocking(False)
+    except (socket.error, OSError):
+        sock.close()
+        raise
+    return sock
+
+def search(services, timeout=5, mx=1, until=None, accept=None, interfaces=None, preferred=None, trace=None):
+    """Send M-SEARCH for every service on every IPv4 interface and yield SSDPRecord responses as they arrive.
+    preferred interface is searched first. accept(record) filters responders before any further processing.
+    until(record) may return number of seconds to keep listening - 0 stops the search.
+    trace(outgoing, datagram) is called with every datagram sent and received"""
+    if isinstance(services, str):
+        services = [services]
+    if interfaces is None:
+        interfaces = getNetworkIps()
+    if preferred in interfaces:
+        interfaces = [preferred] + [x for x in interfaces if x != preferred]
     group = ("239.255.255.250", 1900)
     message = "\r\n".join([
         'M-SEARCH * HTTP/1.1',
@@ -47,25 +86,123 @@ def discover(service, timeout=5, retries=1, mx=3):
         'MX: {mx}',
         'Content-Length: 0',
         '',''])
-    socket.setdefaulttimeout(timeout)
+    selector = selectors.DefaultSelector()
+    try:
+        for interface in interfaces:
+            sock = None
+            try:
+                sock = searchSocket(interface)
+                for service in services:
+                    datagram = message.format(*group, st=service, mx=mx).encode('utf-8')
+                    sock.sendto(datagram, group)
+                    if trace: trace(True, datagram)
+                selector.register(sock, selectors.EVENT_READ, interface)
+                sock = None     # closed with the selector from now on
+            except (socket.error, OSError):
+                continue
+            finally:
+                if sock: sock.close()
+        if not selector.get_map(): return
+        # Per-socket deadline instead of process-wide default timeout
+        deadline = time.monotonic() + timeout
+        seen = set()
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: break
+            events = selector.select(remaining)
+            if not events: break
+            for key, mask in events:
+                try:
+                    # Full-size datagram - large responses are not truncated
+                    datagram = key.fileobj.recv(65507)
+                except (socket.error, OSError):
+                    continue
+                if trace: trace(False, datagram)
+                record = parseResponse(datagram, key.data)
+                if record is None or record.location in seen: continue
+                seen.add(record.location)
+                if accept and not accept(record): continue
+                yield record
+                if until:
+                    extra = until(record)
+                    if extra is not None:
+                        deadline = min(deadline, time.monotonic() + extra)
+    finally:
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+
+def discover(service, timeout=5, retries=1, mx=3):
     responses = {}
     for _ in range(retries):
+        for record in search(service, timeout=timeout, mx=mx):
+            responses[record.location] = record._asdict()
+    return list(responses.values())
+
+def parseHeaders(datagram):
+    # Start line and lower-cased headers of an SSDP datagram
+    lines = datagram.decode('utf-8', 'replace').split('\r\n')
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return lines[0], headers
+
+class NotifyListener(threading.Thread):
+    """Passive listener for ssdp:alive / ssdp:byebye announcements.
+    callback(headers) is called for every NOTIFY whose NT is in targets.
+    onError(exception) is called if the listener cannot be started"""
+    def __init__(self, callback, targets=samsungTargets, onError=None):
+        threading.Thread.__init__(self, name='SSDPNotifyListener')
+        self.daemon = True
+        self.callback = callback
+        self.targets = targets
+        self.onError = onError
+        self.running = True
+        self.sock = None
+
+    def open(self):
+        group = "239.255.255.250"
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
-        message_bytes = message.format(*group, st=service, mx=mx).encode('utf-8')
-        sock.bind((getNetworkIp(), 0))  # Bind on any free port on local interface
-        sock.sendto(message_bytes, group)
-        while True:
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(('', 1900))
+        # Join the group on every interface so announcements are heard on all networks
+        joined = 0
+        for interface in getNetworkIps() or ['0.0.0.0']:
+            membership = struct.pack('4s4s', socket.inet_aton(group), socket.inet_aton(interface))
             try:
-                received = sock.recv(1024)
-                print(received)
-                response = SSDPResponse(received)
-                responses[response.location] = json.loads(response.toJson())
-            except socket.timeout:
-                break
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+                joined += 1
+            except (socket.error, OSError):
+                pass
+        if not joined:
+            sock.close()
+            raise OSError('cannot join ' + group)
+        self.sock = sock
 
-    return list(responses.values())
+    def run(self):
+        try:
+            self.open()
+        except (socket.error, OSError) as e:
+            if self.onError: self.onError(e)
+            return
+        while self.running:
+            try:
+                if not select.select([self.sock], [], [], 1)[0]: continue
+                startLine, headers = parseHeaders(self.sock.recv(65507))
+            except (socket.error, ValueError):
+                continue
+            if startLine.startswith('NOTIFY') and headers.get('nt') in self.targets:
+                self.callback(headers)
+        self.sock.close()
+
+    def stop(self):
+        self.running = False
+        if self.is_alive():
+            self.join(2)
 
 def getNetworkIp():
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
@@ -74,6 +211,45 @@ def getNetworkIp():
     s.connect(('<broadcast>', 0))
     return s.getsockname()[0]
 
+def getInterfaceIps():
+    # IPv4 address of every network interface. Works where SIOCGIFADDR ioctl is available (Linux, Android)
+    ips = []
+    try:
+        import fcntl
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    except (ImportError, socket.error, OSError):
+        return ips
+    try:
+        for index, name in socket.if_nameindex():
+            try:
+                request = struct.pack('256s', name.encode('utf-8')[:15])
+                ips.append(socket.inet_ntoa(fcntl.ioctl(probe.fileno(), 0x8915, request)[20:24]))  # SIOCGIFADDR
+            except (OSError, IOError):
+                pass
+    except (AttributeError, OSError):
+        pass
+    finally:
+        probe.close()
+    return ips
+
+def getNetworkIps():
+    # Usable local IPv4 addresses - interface of the default route first, loopback excluded
+    candidates = []
+    try:
+        candidates.append(getNetworkIp())
+    except (socket.error, OSError):
+        pass
+    candidates.extend(getInterfaceIps())
+    try:
+        candidates.extend(socket.gethostbyname_ex(socket.gethostname())[2])
+    except (socket.error, OSError):
+        pass
+    ips = []
+    for ip in candidates:
+        if ip not in ips and not ip.startswith('127.') and not ip.startswith('0.'):
+            ips.append(ip)
+    return ips
+
 # Example:
 # import ssdp
 # ssdp.discover("ssdp:all")
\ No newline at end of file
@@ -0,0 +1,56 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# JSON state files in the addon profile.
+# Files are written to a temporary file in the same directory and then moved
+# over the old one, so Kodi being killed in the middle of a write leaves the
+# previous version in place instead of a truncated file.
+
+import json
+import os
+import tempfile
+
+def loadJSON(path, default = None):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return default
+
+def writeFile(path, data):
+    # Returns False if the file could not be written
+    directory = os.path.dirname(path)
+    tmp = None
+    try:
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp = tempfile.mkstemp(prefix = os.path.basename(path) + '.', suffix = '.tmp', dir = directory or None)
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return True
+    except (IOError, OSError):
+        if tmp:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+        return False
+
+def saveJSON(path, data):
+    return writeFile(path, json.dumps(data))
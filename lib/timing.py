@@ -0,0 +1,139 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Adaptive key delays. Every TV gets a latency profile built from key
+# acknowledgement times. A configured P<ms> wait is shortened step by step
+# towards the measured latency plus a safety margin, but only after switches
+# in which every key was acknowledged. Any lost key resets the profile to the
+# configured delays. TVs acknowledge keys before their menus have opened, so
+# an acknowledgement does not prove a delay long enough - delays never go
+# below floorRatio of the configured value. The profile also remembers how long it took to open a
+# session over each remote transport, so the fastest one is tried first.
+
+import threading
+import lib.storage as storage
+
+class LatencyProfile(object):
+    def __init__(self, data = None, window = 20, minSamples = 5, marginMs = 300, floorRatio = 0.75):
+        data = data or {}
+        self.samples    = data.get('samples', {})   # key -> recent ack latencies in ms
+        self.proven     = data.get('proven', {})    # step -> shortest delay in ms that worked
+        self.transports = data.get('transports', {})    # transport -> session open time in ms, None if never worked
+        self.window     = window
+        self.minSamples = minSamples
+        self.marginMs   = marginMs
+        self.floorRatio = floorRatio
+        self.trial      = {}
+        self.trialLost  = False
+        self.lock       = threading.Lock()
+
+    def toDict(self):
+        with self.lock:
+            return {'samples': dict(self.samples), 'proven': dict(self.proven), 'transports': dict(self.transports)}
+
+    def record(self, key, seconds):
+        # Called for every acknowledged (or lost when seconds is None) key
+        with self.lock:
+            if seconds is None:
+                self.trialLost = True
+                self.proven = {}
+                return
+            keySamples = self.samples.setdefault(key, [])
+            keySamples.append(int(seconds * 1000))
+            del keySamples[:-self.window]
+
+    def percentile(self, key, pct = 95):
+        keySamples = sorted(self.samples.get(key, []))
+        if not keySamples: return None
+        return keySamples[min(len(keySamples) - 1, int(len(keySamples) * pct / 100))]
+
+    def floor(self, configuredMs):
+        return int(configuredMs * self.floorRatio)
+
+    def target(self, key, configuredMs):
+        # Shortest delay we are willing to try after this key
+        if len(self.samples.get(key, [])) < self.minSamples: return configuredMs
+        latency = self.percentile(key)
+        return min(configuredMs, max(self.floor(configuredMs), latency + self.marginMs))
+
+    def delayFor(self, key, configuredMs):
+        step = str(key) + '/' + str(configuredMs)
+        with self.lock:
+            # Delays proven by older profiles may lie below the floor
+            delay = min(configuredMs, max(self.floor(configuredMs), self.proven.get(step, configuredMs)))
+            if delay > self.target(key, configuredMs):
+                self.trial[step] = delay
+            return delay
+
+    def beginTrial(self):
+        with self.lock:
+            self.trial = {}
+            self.trialLost = False
+
+    def endTrial(self, success = True):
+        # Move every delay used in a clean switch halfway towards its target
+        # success must only be True once all keys of the switch have been acknowledged
+        with self.lock:
+            if success and not self.trialLost:
+                for step, delay in self.trial.items():
+                    key, configuredMs = step.rsplit('/', 1)
+                    target = self.target(key, int(configuredMs))
+                    self.proven[step] = max(target, delay - (delay - target + 1) // 2)
+            self.trial = {}
+
+    def recordTransport(self, name, seconds):
+        # A transport that has worked before keeps its time when TV is just off
+        with self.lock:
+            if seconds is None:
+                self.transports.setdefault(name, None)
+                return
+            ms = int(seconds * 1000)
+            previous = self.transports.get(name)
+            self.transports[name] = ms if previous is None else (previous * 3 + ms) // 4
+
+    def transportOrder(self, names):
+        # Fastest working transport first, then untried ones, then ones that never worked
+        with self.lock:
+            def rank(name):
+                if name not in self.transports: return (1, 0)
+                if self.transports[name] is None: return (2, 0)
+                return (0, self.transports[name])
+            return sorted(names, key = rank)
+
+class TimingProfiles(object):
+    def __init__(self, path):
+        self.path       = path
+        self.profiles   = {}
+        self.lock       = threading.Lock()  # sessions of several TVs use their profiles in parallel
+        self.load()
+
+    def load(self):
+        data = storage.loadJSON(self.path, {})
+        self.profiles = dict((tv, LatencyProfile(tvData)) for tv, tvData in data.items())
+
+    def save(self):
+        # Held while writing as well, so an older snapshot never replaces a newer one
+        with self.lock:
+            data = dict((tv, profile.toDict()) for tv, profile in self.profiles.items())
+            storage.saveJSON(self.path, data)
+
+    def profile(self, tv):
+        with self.lock:
+            if tv not in self.profiles:
+                self.profiles[tv] = LatencyProfile()
+            return self.profiles[tv]
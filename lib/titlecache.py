@@ -0,0 +1,67 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Per-title stereoscopic mode cache.
+# Bounded LRU mapping a hash of the media path to the 3D mode last observed for
+# it. Only stereoscopic titles are kept, so a known title can be switched as
+# soon as playback starts.
+
+import collections
+import hashlib
+import json
+import threading
+import lib.storage as storage
+
+def titleKey(path):
+    return hashlib.sha1(path.encode('utf-8')).hexdigest()[:20]
+
+class TitleModeCache(object):
+    def __init__(self, path, capacity = 500):
+        self.path       = path
+        self.capacity   = capacity
+        self.titles     = collections.OrderedDict()    # title key -> mode, least recently used first
+        self.lock       = threading.Lock()
+        self.load()
+
+    def load(self):
+        entries = storage.loadJSON(self.path, [])
+        self.titles = collections.OrderedDict((key, mode) for key, mode in entries[-self.capacity:])
+
+    def save(self):
+        with self.lock:
+            data = json.dumps(list(self.titles.items()))
+        storage.writeFile(self.path, data)
+
+    def get(self, path):
+        key = titleKey(path)
+        with self.lock:
+            if key not in self.titles: return None
+            self.titles.move_to_end(key)
+            return self.titles[key]
+
+    def put(self, path, mode):
+        key = titleKey(path)
+        with self.lock:
+            self.titles[key] = mode
+            self.titles.move_to_end(key)
+            while len(self.titles) > self.capacity:
+                self.titles.popitem(last = False)
+
+    def evict(self, path):
+        with self.lock:
+            return self.titles.pop(titleKey(path), None) is not None
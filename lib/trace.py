@@ -0,0 +1,140 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Protocol traffic recorder.
+# Raw bytes of the port 55000 sessions and of SSDP searches are written with
+# monotonic timestamps to a compact binary trace, so firmware specific timing
+# and framing can be replayed offline (see bench/replay.py).
+# File layout:
+#   magic | records
+#   record: float64 seconds since start | uint8 event | uint32 stream | uint32 length | data
+# Stream numbers tell TCP connections apart. SSDP records use stream 0.
+
+import collections
+import os
+import struct
+import threading
+import time
+
+magic           = b'3DTRACE2'
+_record         = struct.Struct('<dBII')
+
+# Events
+OPEN            = 1     # connection established, data is 'ip:port'
+SEND            = 2     # bytes sent to the TV
+RECV            = 3     # bytes received from the TV, empty when TV closed the connection
+CLOSE           = 4     # connection closed by us
+SSDP_SEND       = 5     # M-SEARCH datagram
+SSDP_RECV       = 6     # M-SEARCH response
+
+TraceRecord = collections.namedtuple('TraceRecord', ['time', 'event', 'stream', 'data'])
+
+class TraceRecorder(object):
+    def __init__(self, path, maxBytes = 4 * 1024 * 1024):
+        self.path       = path
+        self.maxBytes   = maxBytes      # recording stops silently once the trace reaches this size
+        self.size       = 0
+        self.streams    = 0
+        self.started    = time.monotonic()
+        self.lock       = threading.Lock()
+        self.file       = None
+        try:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            self.file = open(self.path, 'wb')
+            self.file.write(magic)
+            self.size = len(magic)
+        except (IOError, OSError):
+            self.file = None
+
+    def newStream(self):
+        with self.lock:
+            self.streams += 1
+            return self.streams
+
+    def record(self, event, data = b'', stream = 0):
+        if not self.file: return
+        with self.lock:
+            if not self.file or self.size + _record.size + len(data) > self.maxBytes: return
+            # Tracing must never break the connection it observes - a record that cannot be written is dropped
+            try:
+                header = _record.pack(time.monotonic() - self.started, event, stream, len(data))
+            except struct.error:
+                return
+            try:
+                self.file.write(header)
+                self.file.write(data)
+                # Flushed per record - a trace is most interesting when Kodi is killed in the middle of a switch
+                self.file.flush()
+                self.size += _record.size + len(data)
+            except (IOError, OSError, ValueError):
+                pass
+
+    def wrap(self, sock):
+        return RecordingSocket(sock, self, self.newStream())
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+class RecordingSocket(object):
+    '''Socket proxy recording everything that passes through it. Other calls go to the socket'''
+    def __init__(self, sock, recorder, stream):
+        self.sock       = sock
+        self.recorder   = recorder
+        self.stream     = stream
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def connect(self, address):
+        self.sock.connect(address)
+        self.recorder.record(OPEN, ('%s:%d' % address).encode('ascii'), self.stream)
+
+    def send(self, data):
+        sent = self.sock.send(data)
+        self.recorder.record(SEND, bytes(data[:sent]), self.stream)
+        return sent
+
+    def sendall(self, data):
+        self.sock.sendall(data)
+        self.recorder.record(SEND, bytes(data), self.stream)
+
+    def recv(self, size, *args):
+        data = self.sock.recv(size, *args)
+        self.recorder.record(RECV, data, self.stream)
+        return data
+
+    def close(self):
+        self.recorder.record(CLOSE, b'', self.stream)
+        self.sock.close()
+
+def readTrace(path):
+    # Yields TraceRecord tuples. A record cut short by a crash ends the trace
+    with open(path, 'rb') as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError('Not a 3D Enabler trace: ' + path)
+        while True:
+            header = f.read(_record.size)
+            if len(header) < _record.size: return
+            seconds, event, stream, length = _record.unpack(header)
+            data = f.read(length)
+            if len(data) < length: return
+            yield TraceRecord(seconds, event, stream, data)
@@ -0,0 +1,63 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# UPnP device description fetch.
+# Descriptions are downloaded concurrently by a small thread pool. Each
+# download has its own timeout and size cap and XML is parsed incrementally
+# until the fields we need have been seen.
+
+import concurrent.futures
+import urllib.request
+import xml.etree.ElementTree as ElementTree
+
+descriptionFields = ('friendlyName', 'modelName', 'UDN')
+
+def fetchDescription(location, timeout=2, maxBytes=65536, chunkSize=4096, fields=descriptionFields):
+    # Returns dict with found fields. HTTP errors are raised to the caller
+    found = {}
+    parser = ElementTree.XMLPullParser(events=('end',))
+    received = 0
+    response = urllib.request.urlopen(location, timeout=timeout)
+    try:
+        while received < maxBytes and len(found) < len(fields):
+            chunk = response.read(min(chunkSize, maxBytes - received))
+            if not chunk: break
+            received += len(chunk)
+            try:
+                parser.feed(chunk)
+                for event, element in parser.read_events():
+                    tag = element.tag.rsplit('}', 1)[-1]
+                    if tag in fields and tag not in found and element.text:
+                        found[tag] = element.text.strip()
+            except ElementTree.ParseError:
+                break
+    finally:
+        response.close()
+    return found
+
+class DescriptionFetcher(object):
+    def __init__(self, workers=4, timeout=2, maxBytes=65536):
+        self.timeout    = timeout
+        self.maxBytes   = maxBytes
+        self.pool       = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, location):
+        return self.pool.submit(fetchDescription, location, self.timeout, self.maxBytes)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,145 @@
+'''
+    3D Enabler [for] Samsung TV - addon for XBMC to enable 3D mode
+    Copyright (C) 2021  Pavel Kuzub
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Websocket remote control API of newer (Tizen) Samsung TVs on ports 8001/8002.
+# WebsocketRemote offers the same send(frames) / alive / stop() interface as
+# pipeline.KeyPipeline so the session can use either transport. The pairing
+# token handed out by the TV is kept in TokenStore, so later sessions do not
+# bring up the permission prompt again.
+# ssl and websocket are imported on first connect - most TVs use the legacy
+# transport and the service should not pay for them at startup.
+
+import base64
+import json
+import threading
+import lib.storage as storage
+
+class TokenStore(object):
+    def __init__(self, path):
+        self.path   = path
+        self.tokens = storage.loadJSON(self.path, {})
+        self.lock   = threading.Lock()
+
+    def get(self, tv):
+        return self.tokens.get(tv)
+
+    def set(self, tv, token):
+        with self.lock:
+            if not token or self.tokens.get(tv) == token: return
+            self.tokens[tv] = token
+            storage.saveJSON(self.path, self.tokens)
+
+class WebsocketRemote(object):
+    def __init__(self, ip, name, token = None, onToken = None, timeout = 3, pairingTimeout = 30):
+        self.ip             = ip
+        self.name           = base64.b64encode(name.encode('utf-8')).decode('ascii')
+        self.token          = token
+        self.onToken        = onToken       # called with new pairing token
+        self.timeout        = timeout
+        self.pairingTimeout = pairingTimeout
+        self.ws             = None
+        self.alive          = False
+        self.running        = False
+        self.reader         = None
+        self.lock           = threading.Lock()
+
+    def urls(self):
+        import ssl
+        path = '/api/v2/channels/samsung.remote.control?name=' + self.name
+        # Secure port first when we already hold a token - plain port does not need one
+        secure = ('wss://' + self.ip + ':8002' + path + ('&token=' + self.token if self.token else ''), {'cert_reqs': ssl.CERT_NONE})
+        plain = ('ws://' + self.ip + ':8001' + path, None)
+        return [secure, plain] if self.token else [plain, secure]
+
+    def connect(self):
+        import websocket
+        for url, sslopt in self.urls():
+            try:
+                ws = websocket.create_connection(url, timeout = self.timeout, sslopt = sslopt)
+            except Exception:
+                continue
+            if self.handshake(ws):
+                self.ws = ws
+                self.alive = True
+                self.running = True
+                self.reader = threading.Thread(target = self._read, name = '3DEnablerWebsocketReader')
+                self.reader.daemon = True
+                self.reader.start()
+                return True
+            ws.close()
+        return False
+
+    def handshake(self, ws):
+        # TV answers with ms.channel.connect once access is granted (possibly after the permission prompt)
+        ws.settimeout(self.pairingTimeout)
+        try:
+            while True:
+                message = json.loads(ws.recv())
+                event = message.get('event')
+                if event == 'ms.channel.connect':
+                    token = (message.get('data') or {}).get('token')
+                    if token and token != self.token:
+                        self.token = token
+                        if self.onToken: self.onToken(token)
+                    return True
+                if event in ('ms.channel.unauthorized', 'ms.channel.timeOut'):
+                    return False
+        except Exception:
+            return False
+        finally:
+            ws.settimeout(None)
+
+    def send(self, frames):
+        # frames: list of (key, frame) as for KeyPipeline - only key names are used here
+        if not self.alive: return False
+        try:
+            with self.lock:
+                for key, frame in frames:
+                    self.ws.send(json.dumps({'method': 'ms.remote.control', 'params': {
+                        'Cmd': 'Click', 'DataOfCmd': key, 'Option': 'false', 'TypeOfRemote': 'SendRemoteKey'}}))
+        except Exception:
+            self.alive = False
+            return False
+        return True
+
+    def waitForAcks(self, timeout):
+        # Websocket remote does not acknowledge keys
+        return self.alive
+
+    def _read(self):
+        # Drain events from the TV and notice when it closes the connection
+        import websocket
+        while self.running and self.alive:
+            try:
+                if not self.ws.recv():
+                    self.alive = False
+            except websocket.WebSocketTimeoutException:
+                continue
+            except Exception:
+                self.alive = False
+
+    def stop(self):
+        self.running = False
+        self.alive = False
+        if self.ws:
+            try:
+                self.ws.close()
+            except Exception:
+                pass
+        if self.reader and self.reader.is_alive() and self.reader is not threading.current_thread():
+            self.reader.join(1)
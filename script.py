@@ -16,8 +16,30 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
+def showStats(addon):
+    # Timing histograms collected by the service
+    import os
+    import time
+    import xbmcvfs
+    import lib.metrics as metrics
+    stats = metrics.loadStats(os.path.join(xbmcvfs.translatePath(addon.getAddonInfo('profile')), 'stats.json'))
+    if not stats or not stats.get('spans'):
+        xbmcgui.Dialog().ok(addon.getAddonInfo('name'), addon.getLocalizedString(30531)) #No statistics collected yet
+        return
+    lines = [addon.getLocalizedString(30532) + ': ' + time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stats.get('updated', 0))), ''] #Updated
+    for name, span in sorted(stats['spans'].items()):
+        if 'p50' in span:
+            lines.append('%-18s n=%-6d p50 %8.1f ms   p95 %8.1f ms   max %8.1f ms' % (name, span['count'], span['p50'], span['p95'], span['max']))
+    for name, count in sorted(stats.get('counters', {}).items()):
+        lines.append('%-18s %d' % (name, count))
+    xbmcgui.Dialog().textviewer(addon.getAddonInfo('name') + ': ' + addon.getLocalizedString(30530), '\n'.join(lines)) #Timing statistics
+
 if __name__ == "__main__":
+    import sys
     import xbmcgui
     import xbmc
     import xbmcaddon
-    xbmcaddon.Addon().openSettings()
+    if len(sys.argv) > 1 and sys.argv[1] == 'stats':
+        showStats(xbmcaddon.Addon())
+    else:
+        xbmcaddon.Addon().openSettings()
@@ -16,23 +16,46 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
+import time
+startTime   = time.monotonic()  # startup time is reported from here
 import os
 import sys
 import xbmc
 import xbmcgui
 import xbmcaddon
+import xbmcvfs
 import json as simplejson
 import socket
 import re
-import urllib.request, urllib.error, urllib.parse
-from xml.dom.minidom import parseString
-import base64
-import uuid
 import select
 import lib.ssdp as ssdp
+import lib.registry as registry
+import lib.reachability as reachability
+import lib.codec as codec
+import lib.pipeline as pipeline
+import lib.timing as timing
+import lib.planner as planner
+import lib.wsremote as wsremote
+import lib.titlecache as titlecache
+import lib.metrics as metrics
+import lib.trace as trace
 import struct
-import websocket
+import threading
+import collections
+# Network and XML heavy modules (urllib, uuid, lib.upnp, concurrent.futures, websocket)
+# are imported on first use so they do not slow down Kodi startup
 __addon__   = xbmcaddon.Addon()
+debugLogging = True     # refreshed from Kodi once the service is running
+maxWorkers  = 8         # additional TVs switched in parallel
+barrierTimeout = 30     # seconds a TV waits for the others before closing its sequence
+targets     = []        # TVTarget of every additional TV
+targetsLock = threading.Lock()  # additional TVs save their modes from worker threads
+workers     = None      # pool switching additional TVs - created on first use
+startupDelay = 10       # seconds of idle time before deferred startup work runs
+startupDone = False
+authMessages = {}       # local IP -> encoded auth message
+recorder    = None      # TraceRecorder while protocol tracing is turned on
+ssdpInterfaces = None   # interfaces searched by discovery, None - every IPv4 interface but loopback
 
 keyMap = {
           '3D'      :'KEY_PANNEL_CHDOWN',
@@ -51,43 +74,77 @@ ssdpModeMap = [
         'urn:dial-multiscreen-org:device:dialreceiver:1'
     ]
 
+transportMap = [
+        ['legacy', 'websocket'],
+        ['legacy'],
+        ['websocket']
+    ]
+
+transportPorts = {
+        'legacy'    : (55000,),
+        'websocket' : (8001, 8002)
+    }
+
+# Release naming markers of stereoscopic videos used as an early hint at playback start
+stereoMarkers = re.compile(r'(?:^|[^a-z0-9])(3d|sbs|hsbs|tab|hou|mvc)(?:[^a-z0-9]|$)', re.IGNORECASE)
+
 stereoscopicModeMap = {
 	'off' : 0,
 	'split_horizontal' : 1,
 	'split_vertical' : 2
 }
 
+def refreshLogLevel():
+    global debugLogging
+    debugLogging = bool(xbmc.getCondVisibility('System.GetBool(debug.showloginfo)'))
+
+def logDebug(message, *args):
+    # Message is only formatted when Kodi debug logging is on - hot paths must not pay for it
+    if not debugLogging: return
+    xbmc.log(message % args if args else message, xbmc.LOGDEBUG)
+
 class responsePayloadMapping(object):
     def __init__(self):
-        self.waiting        = '\x0A\x00\x01\x00\x00\x00'
-        self.requested      = '\x0A\x00\x02\x00\x00\x00'
-        self.disconnected   = '\x0A\x00\x15\x00\x00\x00'
-        self.denied         = '\x64\x00\x00\x00'
-        self.granted        = '\x64\x00\x01\x00'
-        self.timeout        = '\x65\x00'
+        self.waiting        = b'\x0A\x00\x01\x00\x00\x00'
+        self.requested      = b'\x0A\x00\x02\x00\x00\x00'
+        self.disconnected   = b'\x0A\x00\x15\x00\x00\x00'
+        self.denied         = b'\x64\x00\x00\x00'
+        self.granted        = b'\x64\x00\x01\x00'
+        self.timeout        = b'\x65\x00'
 
 class Settings(object):
+    # Addon settings read by load() and their types
+    settingTypes = collections.OrderedDict([
+        ('enabled', bool), ('discover', bool), ('ipaddress', str), ('tvname', str), ('tvudn', str), ('extratvs', list),
+        ('pause', bool), ('black', bool), ('notifications', bool), ('curTVmode', int), ('ssdpmode', int),
+        ('detectmode', int), ('adaptive', bool), ('transport', int), ('pollsec', int), ('idlesec', int),
+        ('skipInScreensaver', bool), ('tracing', bool), ('sequence3DTAB', str), ('sequence3DSBS', str), ('sequence3Dnone', str),
+        ('sequence3DTABtoSBS', str), ('sequence3DSBStoTAB', str)
+    ])
+
     def __init__(self):
         self.enabled        = True
         self.discover       = True
         self.ipaddress      = ''
         self.tvname         = ''
+        self.tvudn          = ''
+        self.extratvs       = []        # additional TVs following the main one - IP addresses or names
         self.pause          = True
         self.black          = True
         self.notifications  = True
         self.notifymessage  = ''
-        self.sock           = False
         self.authCount      = 0
-        self.pollCount      = 0
-        self.curTVmode      = getTranslatedStereoscopicMode()
+        self.curTVmode      = 0         # persisted value until deferredStartup() asks Kodi
         self.newTVmode      = 0
-        self.ssdpmode       = 1
+        self.ssdpmode       = 4
         self.detectmode     = 0
+        self.adaptive       = False
+        self.transport      = 0
         self.pollsec        = 5
         self.idlesec        = 5
-        self.inProgress     = False
         self.inScreensaver  = False
         self.skipInScreensaver  = True
+        self.tracing        = False
         self.addonname      = __addon__.getAddonInfo('name')
         self.icon           = __addon__.getAddonInfo('icon')
         self.sequenceBegin  = 'BLACKON,PAUSE'
@@ -95,14 +152,23 @@ class Settings(object):
         self.sequence3DTAB  = '3D,P4000,RIGHT,P1200,RIGHT,P1200,EXIT'
         self.sequence3DSBS  = '3D,P4000,RIGHT,P1200,EXIT'
         self.sequence3Dnone = '3D,P1200'
+        self.sequence3DTABtoSBS = ''
+        self.sequence3DSBStoTAB = ''
+        self.sequenceNames  = ['sequenceBegin', 'sequenceEnd', 'sequence3DTAB', 'sequence3DSBS', 'sequence3Dnone', 'sequence3DTABtoSBS', 'sequence3DSBStoTAB']
+        self.compiled       = {}
+        self.modeGraph      = None
+        self.values         = {}        # raw values from the last load - used to tell what has changed
         self.remotename     = '3D Enabler'
         self.appstring      = 'iphone.3DEnabler.iapp.samsung'
-        self.setSetting('curTVmode', self.curTVmode)
 
         self.load()
         
     def getSetting(self, name, dataType = str):
-        value = __addon__.getSetting(name)
+        value = self.convert(__addon__.getSetting(name), dataType)
+        logDebug("3D Enabler::Settings::getSetting:%s=%s", name, value)
+        return value
+
+    def convert(self, value, dataType):
         if dataType == bool:
             if value.lower() == 'true':
                 value = True
@@ -110,9 +176,10 @@ class Settings(object):
                 value = False
         elif dataType == int:
             value = int(value)
+        elif dataType == list:
+            value = [x.strip() for x in value.split(',') if x.strip()]
         else:
             value = str(value)
-        xbmc.log("3D Enabler::Settings::getSetting:" + str(name) + "=" + str(value), xbmc.LOGDEBUG)
         return value
     
     def setSetting(self, name, value):
@@ -123,30 +190,56 @@ class Settings(object):
                 value = 'false'
         else:
             value = str(value)
-        xbmc.log("3D Enabler::Settings::setSetting:" + str(name) + "=" + str(value), xbmc.LOGDEBUG)
+        logDebug("3D Enabler::Settings::setSetting:%s=%s", name, value)
+        # Our own writes must not look like changes made by the user
+        if name in self.values: self.values[name] = value
         __addon__.setSetting(name, value)
     
     def getLocalizedString(self, stringid):
         return __addon__.getLocalizedString(stringid)
     
     def load(self):
-        xbmc.log("3D Enabler::Settings::load: loading Settings", xbmc.LOGINFO)
-        self.enabled            = self.getSetting('enabled', bool)
-        self.discover           = self.getSetting('discover', bool)
-        self.ipaddress          = self.getSetting('ipaddress', str)
-        self.tvname             = self.getSetting('tvname', str)
-        self.pause              = self.getSetting('pause', bool)
-        self.black              = self.getSetting('black', bool)
-        self.notifications      = self.getSetting('notifications', bool)
-        self.curTVmode          = self.getSetting('curTVmode', int)
-        self.ssdpmode           = self.getSetting('ssdpmode', int)
-        self.detectmode         = self.getSetting('detectmode', int)
-        self.pollsec            = self.getSetting('pollsec', int)
-        self.idlesec            = self.getSetting('idlesec', int)
-        self.skipInScreensaver  = self.getSetting('skipInScreensaver', bool)
-        self.sequence3DTAB      = self.getSetting('sequence3DTAB', str)
-        self.sequence3DSBS      = self.getSetting('sequence3DSBS', str)
-        self.sequence3Dnone     = self.getSetting('sequence3Dnone', str)
+        # Returns names of settings that have changed since the previous load
+        raw = dict((name, __addon__.getSetting(name)) for name in self.settingTypes)
+        changed = set(name for name in self.settingTypes if raw[name] != self.values.get(name))
+        self.values = raw
+        for name in self.settingTypes:
+            if name not in changed: continue
+            setattr(self, name, self.convert(raw[name], self.settingTypes[name]))
+            logDebug("3D Enabler::Settings::load:%s=%s", name, getattr(self, name))
+        if changed:
+            xbmc.log("3D Enabler::Settings::load: Changed settings: " + ', '.join(sorted(changed)), xbmc.LOGINFO)
+        # Only edited sequences are compiled again
+        if not self.compiled:
+            self.compileSequences()
+        elif changed.intersection(self.sequenceNames):
+            self.compileSequences(changed.intersection(self.sequenceNames))
+        return changed
+
+    def compileSequences(self, names = None):
+        # Parse, validate and pre-encode sequences once so a switch only replays cached frames and waits
+        appstring = self.appstring.encode('utf-8')
+        encodeKey = lambda key: codec.encodeKey(appstring, key)
+        errors = []
+        for name in self.sequenceNames:
+            if names is not None and name not in names: continue
+            self.compiled[name], invalid = planner.compileSequence(getattr(self, name), keyMap, encodeKey)
+            errors.extend(name + ': ' + token for token in invalid)
+        if errors:
+            xbmc.log("3D Enabler::Settings::compileSequences: Invalid commands: " + ', '.join(errors), xbmc.LOGWARNING)
+            message = self.getLocalizedString(30520) + ': ' + ', '.join(errors) #Invalid command in sequence
+            self.notifymessage = message if not self.notifymessage else self.notifymessage + '. ' + message
+        # 3D modes as nodes and configured key sequences as edges
+        self.modeGraph = planner.ModeGraph(self.compiled['sequenceBegin'], self.compiled['sequenceEnd'])
+        self.modeGraph.addEdge(0, 1, self.compiled['sequence3DTAB'])
+        self.modeGraph.addEdge(0, 2, self.compiled['sequence3DSBS'])
+        self.modeGraph.addEdge(1, 0, self.compiled['sequence3Dnone'])
+        self.modeGraph.addEdge(2, 0, self.compiled['sequence3Dnone'])
+        # Direct moves between 3D modes are optional
+        if self.compiled['sequence3DTABtoSBS']:
+            self.modeGraph.addEdge(1, 2, self.compiled['sequence3DTABtoSBS'])
+        if self.compiled['sequence3DSBStoTAB']:
+            self.modeGraph.addEdge(2, 1, self.compiled['sequence3DSBStoTAB'])
     
 def toNotify(message):
     if len(settings.notifymessage) == 0:
@@ -167,14 +260,14 @@ def setStereoscopicMode(mode):
     query = '{"jsonrpc": "2.0", "method": "GUI.SetStereoscopicMode", "params": ["' + str(mode) + '"], "id": 1}'
     result = xbmc.executeJSONRPC(query)
     json = simplejson.loads(result)
-    xbmc.log("3D Enabler::setStereoscopicMode: Received JSON response: " + str(json), xbmc.LOGDEBUG)
+    logDebug("3D Enabler::setStereoscopicMode: Received JSON response: %s", json)
     return
 
 def getStereoscopicMode():
     query = '{"jsonrpc": "2.0", "method": "GUI.GetProperties", "params": {"properties": ["stereoscopicmode"]}, "id": 1}'
     result = xbmc.executeJSONRPC(query)
     json = simplejson.loads(result)
-    xbmc.log("3D Enabler::getStereoscopicMode: Received JSON response: " + str(json), xbmc.LOGDEBUG)
+    logDebug("3D Enabler::getStereoscopicMode: Received JSON response: %s", json)
     ret = 'unknown'
     if 'result' in json:
         if 'stereoscopicmode' in json['result']:
@@ -182,19 +275,67 @@ def getStereoscopicMode():
                 ret = json['result']['stereoscopicmode']['mode']
     # "off", "split_vertical", "split_horizontal", "row_interleaved"
     # "hardware_based", "anaglyph_cyan_red", "anaglyph_green_magenta", "monoscopic"
-    xbmc.log("3D Enabler::getStereoscopicMode: ret: " + str(ret), xbmc.LOGDEBUG)
+    logDebug("3D Enabler::getStereoscopicMode: ret: %s", ret)
     return ret
 
 def getTranslatedStereoscopicMode():
     mode = getStereoscopicMode()
-    xbmc.log("3D Enabler::getTranslatedStereoscopicMode: mode: " + str(mode), xbmc.LOGDEBUG)
+    logDebug("3D Enabler::getTranslatedStereoscopicMode: mode: %s", mode)
     if mode == 'split_horizontal': return 1
     elif mode == 'split_vertical': return 2
     else: return 0
 
+class KodiState(object):
+    '''Snapshot of everything relevant for 3D switching fetched with one batched JSON-RPC request.
+    The snapshot is memoized for the current tick and raw responses are compared before parsing'''
+    query = simplejson.dumps([
+        {"jsonrpc": "2.0", "method": "GUI.GetProperties", "params": {"properties": ["stereoscopicmode"]}, "id": "stereo"},
+        {"jsonrpc": "2.0", "method": "XBMC.GetInfoBooleans", "params": {"booleans": ["Player.HasVideo", "Player.Paused"]}, "id": "player"}
+    ])
+    ttl = 0.25
+
+    def __init__(self):
+        self.raw            = None
+        self.fetched        = 0
+        self.changed        = True
+        self.stereomode     = 'unknown'
+        self.hasVideo       = False
+        self.paused         = False
+        self.predicted      = False     # TV was switched from title cache - mode has to be verified
+
+    def refresh(self, force = False):
+        # Returns True if anything relevant has changed since the previous snapshot
+        if not force and time.monotonic() - self.fetched < self.ttl: return self.changed
+        raw = xbmc.executeJSONRPC(self.query)
+        self.fetched = time.monotonic()
+        if raw == self.raw:
+            self.changed = False
+            return False
+        self.raw = raw
+        self.changed = True
+        try:
+            results = dict((x.get('id'), x.get('result', {})) for x in simplejson.loads(raw))
+        except (ValueError, AttributeError, TypeError):
+            # Batch requests are not supported - fall back to single request for the mode
+            logDebug("3D Enabler::KodiState::refresh: Unexpected batch response: %s", raw)
+            self.stereomode = getStereoscopicMode()
+            self.hasVideo = xbmc.Player().isPlayingVideo()
+            self.paused = xbmc.getCondVisibility('Player.Paused')
+            return True
+        self.stereomode = results.get('stereo', {}).get('stereoscopicmode', {}).get('mode', 'unknown')
+        self.hasVideo = bool(results.get('player', {}).get('Player.HasVideo', False))
+        self.paused = bool(results.get('player', {}).get('Player.Paused', False))
+        logDebug("3D Enabler::KodiState::refresh: mode: %s video: %s paused: %s", self.stereomode, self.hasVideo, self.paused)
+        return True
+
+    def translatedMode(self):
+        return stereoscopicModeMap.get(self.stereomode, 0)
+
 def stereoModeHasChanged():
     if settings.curTVmode != settings.newTVmode:
         return True
+    elif any(x.isBehind(settings.newTVmode) for x in targets):
+        return True
     else:
         return False
 
@@ -204,58 +345,112 @@ def getIPfromString(string):
     except:
         return ''
 
+def getFriendlyName(description, timeout = None):
+    # Wait for description fetch to complete and translate failures into display names
+    import urllib.error
+    import concurrent.futures
+    tvFriendlyName = settings.getLocalizedString(30503) #Unknown
+    try:
+        tvFriendlyName = description.result(timeout).get('friendlyName', tvFriendlyName)
+    except concurrent.futures.TimeoutError:
+        # Device trickling its description does not get to hold up discovery
+        xbmc.log("3D Enabler::getFriendlyName: Description is too slow", xbmc.LOGINFO)
+        description.cancel()
+    except urllib.error.HTTPError as e:
+        if e.code == 401:
+            # If Remote Access has been denied - we cannot even read the description
+            tvFriendlyName = settings.getLocalizedString(30501) #Access Denied. Check Permissions
+        else:
+            toNotify(settings.getLocalizedString(30502) + ' ' + str(e))
+            xbmc.log("3D Enabler::getFriendlyName: HTTP Error " + str(e), xbmc.LOGERROR)
+    except Exception as e:
+        xbmc.log("3D Enabler::getFriendlyName: Exception getting friendly name: " + repr(e), xbmc.LOGERROR)
+    return tvFriendlyName
+
+def isDescribedAs(description, tvname):
+    if not description.done() or description.exception(): return False
+    return description.result().get('friendlyName') == tvname
+
+def descriptionTimer():
+    submitted = time.monotonic()
+    def done(description):
+        if not description.cancelled() and not description.exception():
+            stats.record('describe', time.monotonic() - submitted)
+    return done
+
 # Discover Samsung TV. If more than one detected - choose one from the list 
 # To match all devices use ssdp.discover('ssdp:all')
 def discoverTVip():
+    started = time.monotonic()
     tvdevices = []
     tvdevicesIPs = []
     tvdevicesNames = []
-    discoverCount = 0
-    while True:
-        discoverCount += 1
-        #dicovered = ssdp.discover('urn:samsung.com:service:MultiScreenService:1')
-        #dicovered = ssdp.discover('ssdp:all')
-        #dicovered = ssdp.discover('urn:samsung.com:device:RemoteControlReceiver:1')
-        dicovered = ssdp.discover(ssdpModeMap[settings.ssdpmode])
+    knownTV = []
+    if settings.ssdpmode < len(ssdpModeMap):
+        services = ssdpModeMap[settings.ssdpmode]
+    else:
+        # Search for all Samsung device types at once
+        services = ssdp.samsungTargets
+
+    def until(tvdevice):
+        # Once a Samsung TV has answered give others a short moment and complete early
+        if tvdevice.st in ssdp.samsungTargets: return 0.3
+        return None
+
+    # Descriptions are fetched concurrently while SSDP responses keep arriving
+    import lib.upnp as upnp
+    fetcher = upnp.DescriptionFetcher()
+    descriptions = collections.OrderedDict()    # tvip -> future
+    responses = {}
+    # Interface that reached our TV last time is searched first
+    preferred = devices.get(settings.tvudn).get('interface') if settings.tvudn else None
+    foundEarly = False
+    for tvdevice in ssdp.search(services, until = until, accept = ssdp.isSamsung, preferred = preferred, interfaces = ssdpInterfaces, trace = traceSSDP if recorder else None):
         if monitor.abortRequested(): break
-        #if len(dicovered) > 0: break
-        if discoverCount > 0: break
-        
-    discoveredJson = simplejson.dumps(dicovered)
-    xbmc.log("3D Enabler::discoverTVip: discoveredJson: " + str(discoveredJson), xbmc.LOGDEBUG)
-	
-    for tvdevice in dicovered:
-        tvdeviceJson = simplejson.dumps(tvdevice)
-        xbmc.log("3D Enabler::discoverTVip: tvdeviceJson: " + str(tvdeviceJson), xbmc.LOGDEBUG)
-        tvXMLloc = tvdevice["location"]
-        xbmc.log("3D Enabler::discoverTVip: tvXMLloc: " + str(tvXMLloc), xbmc.LOGDEBUG)
+        logDebug("3D Enabler::discoverTVip: tvdevice: %s", tvdevice)
+        tvXMLloc = tvdevice.location
         tvip = getIPfromString(tvXMLloc)
-        if tvip:
-            xbmc.log("3D Enabler::discoverTVip: tvip: " + str(tvip), xbmc.LOGDEBUG)
-            tvFriendlyName = settings.getLocalizedString(30503) #Unknown
-            try:
-                tvXML = urllib.request.urlopen(tvXMLloc).read()
-                xbmc.log("3D Enabler::discoverTVip: tvXML: " + str(tvXML), xbmc.LOGDEBUG)
-                tvXMLdom = parseString(tvXML)
-                tvFriendlyName = tvXMLdom.getElementsByTagName('friendlyName')[0].childNodes[0].toxml()
-            except urllib.error.HTTPError as e:
-                if e.code == 401:
-                    # If Remote Access has been denied - we cannot even read the description
-                    tvFriendlyName = settings.getLocalizedString(30501) #Access Denied. Check Permissions
-                else:
-                    toNotify(settings.getLocalizedString(30502) + ' ' + str(e))
-                    xbmc.log("3D Enabler::discoverTVip: HTTP Error " + str(e), xbmc.LOGERROR)
-            except:
-                xbmc.log("3D Enabler::discoverTVip: Exception getting friendly name", xbmc.LOGERROR)
-            if tvip not in tvdevicesIPs:
-                tvdevicesIPs.append(tvip)
-                tvdevicesNames.append(tvFriendlyName + ' @ ' + tvip)
-                tvdevices.append([tvip, tvFriendlyName])
+        if tvip and tvip not in descriptions:
+            logDebug("3D Enabler::discoverTVip: tvip: %s", tvip)
+            descriptions[tvip] = fetcher.submit(tvXMLloc)
+            descriptions[tvip].add_done_callback(descriptionTimer())
+            responses[tvip] = tvdevice
+        # Our TV has answered - no need to wait for others
+        if settings.tvname and any(isDescribedAs(x, settings.tvname) for x in descriptions.values()):
+            foundEarly = True
+            break
+
+    # One deadline for all descriptions that are still being fetched
+    deadline = time.monotonic() + fetcher.timeout
+    for tvip, description in descriptions.items():
+        if foundEarly and not description.done():
+            # Slow devices would only delay the TV we already have
+            description.cancel()
+            continue
+        tvFriendlyName = getFriendlyName(description, max(0, deadline - time.monotonic()))
+        tvudn = registry.udnFromUsn(responses[tvip].usn)
+        if description.done() and not description.cancelled() and not description.exception():
+            tvudn = description.result().get('UDN', tvudn)
+            devices.update(tvudn, ip = tvip, name = tvFriendlyName, model = description.result().get('modelName'),
+                location = responses[tvip].location, maxAge = registry.maxAgeFromCache(responses[tvip].cache),
+                interface = responses[tvip].interface)
+        tvdevicesIPs.append(tvip)
+        tvdevicesNames.append(tvFriendlyName + ' @ ' + tvip)
+        tvdevices.append([tvip, tvFriendlyName, tvudn])
+        if settings.tvname and tvFriendlyName == settings.tvname:
+            knownTV = [tvip, tvFriendlyName, tvudn]
+    fetcher.shutdown()
+    devices.save()
+    stats.record('discover', time.monotonic() - started)
     
     xbmc.log("3D Enabler::discoverTVip: Discovered devices count: " + str(len(tvdevices)), xbmc.LOGINFO)
         
-    if len(tvdevices) >= 1:
+    if knownTV:
+        toNotify(settings.getLocalizedString(30504) + ': ' + str(knownTV[1])) #Discovered TV
+        return knownTV
+    elif len(tvdevices) >= 1:
         myselect = dialog.select(settings.getLocalizedString(30514), tvdevicesNames) #Select your TV device
+        if myselect < 0: return []
         toNotify(settings.getLocalizedString(30504) + ': ' + str(tvdevices[myselect][1])) #Discovered TV
         return tvdevices[myselect]
     elif len(tvdevices) == 1:
@@ -265,74 +460,86 @@ def discoverTVip():
         toNotify(settings.getLocalizedString(30505)) #Samsung TV is not detected
         return []
 
-def getPayloads(response = ''):
-    xbmc.log("3D Enabler::getPayloads: Parsing response (" + str(len(response)) + "):" + str(response.encode().hex()), xbmc.LOGDEBUG)
-    payloads = []
-    while True:
-        if len(response) < 5: break
-        strLen = int(''.join(reversed(response[1:3])).encode().hex(), 16)
-        paylLen = int(''.join(reversed(response[3+strLen:5+strLen])).encode().hex(), 16)
-        payl = response[5+strLen:5+strLen+paylLen]
-        response = response[5+strLen+paylLen:]
-        payloads.append(payl)
-        xbmc.log("3D Enabler::getPayloads: Payload: " + payl.encode().hex(), xbmc.LOGDEBUG)
+def getPayloads(response = b'', decoder = None):
+    if debugLogging:
+        xbmc.log("3D Enabler::getPayloads: Parsing response (" + str(len(response)) + "):" + response.hex(), xbmc.LOGDEBUG)
+    # Streaming decoder keeps partial frames until the rest arrives
+    if decoder:
+        payloads = decoder.feed(response)
+    else:
+        payloads = codec.decodeFrames(response)
+    if debugLogging:
+        for payl in payloads:
+            xbmc.log("3D Enabler::getPayloads: Payload: " + payl.hex(), xbmc.LOGDEBUG)
     return payloads
 
-# Function to send generic message to TV
-def sendMessage(payload):
-    thisMessage = '\x00' \
-    + chr(len(settings.appstring) & 0xFF) + chr((len(settings.appstring) >> 8) & 0xFF) + settings.appstring \
-    + chr(len(payload) & 0xFF) + chr((len(payload) >> 8) & 0xFF) + payload
+# Function to send generic message to TV and wait for the reply payloads
+def sendMessage(thisMessage, tvSession = None):
+    tvSession = tvSession or session
     try:
-        settings.sock.setblocking(1)
-        settings.sock.send(bytes(thisMessage,'utf-8'))
+        tvSession.sock.setblocking(1)
+        tvSession.sock.sendall(thisMessage)
     except socket.error as e:
-        xbmc.log("3D Enabler::sendMessage: Failed to send: " + thisMessage.encode().hex() + " due to socket error: " + repr(e), xbmc.LOGERROR)
-        return ''
-    ready = select.select([settings.sock], [], [], 10)[0]
-    if ready:
-        return settings.sock.recv(4096).decode('ascii')
+        xbmc.log("3D Enabler::sendMessage: Failed to send: " + thisMessage.hex() + " due to socket error: " + repr(e), xbmc.LOGERROR)
+        return []
+    deadline = time.monotonic() + 10
+    while True:
+        ready = select.select([tvSession.sock], [], [], max(0, deadline - time.monotonic()))[0]
+        if not ready: return []
+        response = tvSession.sock.recv(4096)
+        if not response: return []
+        payloads = getPayloads(response, tvSession.decoder)
+        if payloads: return payloads
+
+def getTVid():
+    return settings.tvname or settings.ipaddress
+
+def onKeyAck(key, seconds, tvid = None):
+    if settings.adaptive:
+        profiles.profile(tvid or getTVid()).record(key, seconds)
+    if seconds is None:
+        stats.count('lost')
+        xbmc.log("3D Enabler::onKeyAck: Key " + key + " was not acknowledged", xbmc.LOGWARNING)
     else:
-        return ''
+        stats.record('ack', seconds)
+        logDebug("3D Enabler::onKeyAck: Key %s acknowledged in %d ms", key, seconds * 1000)
 
-# Function to send keys
-def sendKey(key):
-    key64 = base64.b64encode(bytes(key,'utf-8')).decode('ascii')
-    keyMessage = '\x00\x00\x00' + chr(len(key64) & 0xFF) + chr((len(key64) >> 8) & 0xFF) + key64
-    return sendMessage(keyMessage)
+def getAuthMessage(ip):
+    # Auth message only depends on our IP and MAC - encode it once per local IP
+    if ip not in authMessages:
+        import uuid
+        mac = '-'.join('%02X' %((uuid.getnode() >> 8*i) & 0xff) for i in reversed(range(6)))
+        authMessages[ip] = codec.encodeAuth(settings.appstring.encode('utf-8'), ip, mac, settings.remotename)
+    return authMessages[ip]
 
-def authenticate():
-    if not settings.sock: return False
+def authenticate(tvSession = None, interactive = True):
+    # Permission prompt is only shown in Kodi for interactive authentication of the main TV
+    tvSession = tvSession or session
+    if not tvSession.sock: return False
     # Need client IP and MAC for auth purposes
-    ip64 = base64.b64encode(bytes(settings.sock.getsockname()[0],'utf-8')).decode('ascii')
-    mac64 = base64.b64encode(bytes('-'.join('%02X' %((uuid.getnode() >> 8*i) & 0xff) for i in reversed(range(6))),'utf-8')).decode('ascii')
-    remote64 = base64.b64encode(bytes(settings.remotename,'utf-8')).decode('ascii')
-    authMessage = '\x64\x00' \
-    + chr(len(ip64) & 0xFF) + chr((len(ip64) >> 8) & 0xFF) + ip64 \
-    + chr(len(mac64) & 0xFF) + chr((len(mac64) >> 8) & 0xFF) + mac64 \
-    + chr(len(remote64) & 0xFF) + chr((len(remote64) >> 8) & 0xFF) + remote64
+    authMessage = getAuthMessage(tvSession.sock.getsockname()[0])
     
     gotResponseTriggers = [responseMap.granted, responseMap.denied, responseMap.timeout]
     progressTriggers = [responseMap.waiting, responseMap.requested]
     progressDialogOpen = False
-    settings.authCount = 0
-    response = sendMessage(authMessage)
-    xbmc.log("3D Enabler::authenticate: response: " + response.encode().hex(), xbmc.LOGDEBUG)
-    responsePayloads = getPayloads(response)
+    authCount = 0
+    if tvSession is session: settings.authCount = 0
+    responsePayloads = sendMessage(authMessage, tvSession)
     if any(x in responsePayloads for x in progressTriggers):
         while True:
             if any(x in responsePayloads for x in gotResponseTriggers): break
-            if settings.authCount >= 100: break
-            settings.authCount += 1
-            if not progressDialogOpen:
-                progressDialogOpen = True
-                dialogprogress.create(settings.addonname + ': ' + settings.getLocalizedString(30511), settings.getLocalizedString(30512)) #Authentication    #Your TV is asking for permission    #Please Allow access
-            dialogprogress.update(settings.authCount)
-            ready = select.select([settings.sock], [], [], 0.61)[0]  # TV authentication timeout is ~60 seconds
+            if authCount >= 100: break
+            authCount += 1
+            if tvSession is session: settings.authCount = authCount
+            if interactive:
+                if not progressDialogOpen:
+                    progressDialogOpen = True
+                    dialogprogress.create(settings.addonname + ': ' + settings.getLocalizedString(30511), settings.getLocalizedString(30512)) #Authentication    #Your TV is asking for permission    #Please Allow access
+                dialogprogress.update(authCount)
+            ready = select.select([tvSession.sock], [], [], 0.61)[0]  # TV authentication timeout is ~60 seconds
             if ready:
-                response = settings.sock.recv(4096).decode('ascii')
-                responsePayloads = getPayloads(response)
-            if dialogprogress.iscanceled(): break
+                responsePayloads = getPayloads(tvSession.sock.recv(4096), tvSession.decoder)
+            if progressDialogOpen and dialogprogress.iscanceled(): break
             if monitor.abortRequested(): break
     
     if progressDialogOpen:
@@ -340,44 +547,357 @@ def authenticate():
         progressDialogOpen = False
     
     if responseMap.disconnected in responsePayloads:
-        if connectTV():
-            return authenticate()
+        if connectTV(interactive and tvSession is session, tvSession):
+            return authenticate(tvSession, interactive)
         return False
     elif responseMap.granted in responsePayloads:
         xbmc.log("3D Enabler::authenticate: returned: True", xbmc.LOGDEBUG)
         return True
     else:
         xbmc.log("3D Enabler::authenticate: returned: False", xbmc.LOGDEBUG)
-        toNotify(settings.getLocalizedString(30509)) #Authentication Failed
+        if interactive:
+            toNotify(settings.getLocalizedString(30509)) #Authentication Failed
         return False
 
 def newSock():
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.settimeout(3)
+    # Let the OS detect a silently dropped session between mode switches
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in (('TCP_KEEPIDLE', 30), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+    if recorder: return recorder.wrap(sock)
     return sock
 
-def connectTV():
+class TVSession(object):
+    '''Long-lived authenticated connection to the TV that is reused between mode switches.
+    Session of the main TV has no target, additional TVs pass their TVTarget'''
+    def __init__(self, target = None):
+        self.target         = target
+        self.sock           = False
+        self.ipaddress      = ''
+        self.authenticated  = False
+        self.lastActivity   = 0
+        self.keepaliveSec   = 30
+        self.pipeline       = None      # KeyPipeline or WebsocketRemote
+        self.transport      = None
+        self.prewarmed      = 0         # when session was opened ahead of a switch that has not happened yet
+        self.prewarmIdleSec = 60
+        self.decoder        = codec.FrameDecoder()
+        self.outbox         = []
+
+    def isMain(self):
+        return self.target is None
+
+    def tvid(self):
+        return getTVid() if self.isMain() else self.target.address
+
+    def targetIP(self):
+        return getIPfromString(settings.ipaddress) if self.isMain() else self.target.resolve()
+
+    def tracker(self):
+        return tracker if self.isMain() else self.target.tracker
+
+    def touch(self):
+        self.lastActivity = time.monotonic()
+        self.tracker().markOnline()
+
+    def isAlive(self):
+        # Cheap health check: poll the socket without blocking and look for EOF or a disconnect payload
+        # Once authenticated the transport reader owns the connection and tracks its state
+        if self.pipeline: return self.pipeline.alive
+        if not self.sock: return False
+        try:
+            ready = select.select([self.sock], [], [], 0)[0]
+            if ready:
+                response = self.sock.recv(4096)
+                if not response: return False
+                if responseMap.disconnected in getPayloads(response, self.decoder): return False
+        except (socket.error, ValueError) as e:
+            logDebug("3D Enabler::TVSession::isAlive: Socket error: %r", e)
+            return False
+        self.touch()
+        return True
+
+    def isReady(self):
+        if not self.authenticated: return False
+        if self.ipaddress != self.targetIP(): return False
+        return self.isAlive()
+
+    def open(self, interactive = True):
+        # Reuse already authenticated session if TV is still there
+        if self.isReady():
+            logDebug("3D Enabler::TVSession::open: Reusing authenticated session to %s", self.ipaddress)
+            if self.isMain(): settings.authCount = 0
+            return True
+        self.close()
+        opened = self.openTransports(interactive)
+        # Prewarm and other non-interactive opens stay at the saved address - discovery may ask the user
+        if opened is None and interactive and self.isMain() and rediscoverTV():
+            # Saved address was stale - try every transport again at the discovered one
+            opened = self.openTransports(interactive)
+        if opened: return True
+        if opened is False: return False
+        self.tracker().markOffline()
+        if interactive:
+            toNotify(settings.getLocalizedString(30508)) #Connection Failed
+        return False
+
+    def openTransports(self, interactive = True):
+        # True once a transport is open, False if TV has refused us, None if it could not be reached
+        profile = profiles.profile(self.tvid())
+        for transport in profile.transportOrder(transportMap[settings.transport]):
+            started = time.monotonic()
+            if transport == 'websocket':
+                opened = self.openWebsocket()
+            else:
+                opened = self.openLegacy(False, interactive)
+            if opened is False: return False
+            profile.recordTransport(transport, time.monotonic() - started if opened else None)
+            profiles.save()
+            if opened:
+                logDebug("3D Enabler::TVSession::open: Opened %s session in %d ms", transport, (time.monotonic() - started) * 1000)
+                self.transport = transport
+                return True
+        return None
+
+    def openLegacy(self, discover = True, interactive = True):
+        # None if TV could not be reached, False if it has refused us
+        if not connectTV(discover, self): return None
+        started = time.monotonic()
+        if not authenticate(self, interactive):
+            self.close()
+            return False
+        stats.record('auth', time.monotonic() - started)
+        self.ready()
+        return True
+
+    def openWebsocket(self):
+        if self.isMain(): resolveTVip()
+        ip = self.targetIP()
+        if not ip: return None
+        tvid = self.tvid()
+        remote = wsremote.WebsocketRemote(ip, settings.remotename, tokens.get(tvid), lambda token: tokens.set(tvid, token))
+        logDebug("3D Enabler::TVSession::openWebsocket: Connecting to:%s", ip)
+        started = time.monotonic()
+        if not remote.connect():
+            xbmc.log("3D Enabler::TVSession::openWebsocket: TV does not accept websocket remote", xbmc.LOGINFO)
+            return None
+        stats.record('connect_websocket', time.monotonic() - started)
+        self.ipaddress = ip
+        self.authenticated = True
+        self.pipeline = remote
+        self.touch()
+        return True
+
+    def ready(self):
+        # Mark freshly connected and authenticated socket as reusable
+        self.ipaddress = self.targetIP()
+        self.authenticated = True
+        self.pipeline = pipeline.KeyPipeline(self.sock, self.parse, responseMap.disconnected, self.onKeyAck)
+        self.touch()
+
+    def onKeyAck(self, key, seconds):
+        onKeyAck(key, seconds, self.tvid())
+
+    def parse(self, response):
+        return getPayloads(response, self.decoder)
+
+    def queueFrame(self, key, frame):
+        self.outbox.append((key, frame))
+
+    def flush(self):
+        # Write all queued keys in one go without waiting for acknowledgements
+        if not self.outbox: return True
+        frames = self.outbox
+        self.outbox = []
+        for attempt in range(2):
+            if not self.isReady():
+                # TV has dropped our session - reconnect transparently and repeat the keys
+                xbmc.log("3D Enabler::TVSession::flush: Session is not ready. Reconnecting", xbmc.LOGINFO)
+                if not self.open(self.isMain()): return False
+            if debugLogging:
+                xbmc.log("3D Enabler::TVSession::flush: Sending " + str(len(frames)) + " key(s): " + ','.join(key for key, frame in frames), xbmc.LOGDEBUG)
+            started = time.monotonic()
+            if self.pipeline.send(frames):
+                stats.record('send', time.monotonic() - started)
+                self.prewarmed = 0
+                self.touch()
+                return True
+        return False
+
+    def waitForAcks(self, timeout = 3):
+        # Keys still in flight decide whether a switch has gone through cleanly
+        if not self.pipeline: return False
+        return self.pipeline.waitForAcks(timeout)
+
+    def keepalive(self):
+        # Called periodically from the main loop - drop the session if TV has gone away
+        if not self.sock and not self.pipeline: return
+        if self.prewarmed and time.monotonic() - self.prewarmed > self.prewarmIdleSec:
+            xbmc.log("3D Enabler::TVSession::keepalive: Pre-warmed session to " + str(self.ipaddress) + " was not used", xbmc.LOGDEBUG)
+            self.close()
+            return
+        if time.monotonic() - self.lastActivity < self.keepaliveSec: return
+        if not self.isAlive():
+            xbmc.log("3D Enabler::TVSession::keepalive: Session to " + str(self.ipaddress) + " is gone", xbmc.LOGINFO)
+            self.close()
+
+    def close(self):
+        if self.pipeline:
+            self.pipeline.stop()
+            self.pipeline = None
+        if self.sock:
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+        self.sock = False
+        self.authenticated = False
+        self.transport = None
+        self.prewarmed = 0
+        self.decoder.reset()
+
+class TVTarget(object):
+    '''Additional TV that follows the 3D mode of the main one.
+    Address is an IP address or a TV name known from discovery'''
+    def __init__(self, address, curTVmode = 0):
+        self.address    = address
+        self.curTVmode  = curTVmode
+        self.session    = TVSession(self)
+        # TV that is off is skipped until it answers again - switches must not wait for its connect timeouts
+        self.tracker    = reachability.ReachabilityTracker(self.resolve, getTransportPorts(), onOnline = self.onOnline)
+        self.tracker.start()
+
+    def resolve(self):
+        tvip = getIPfromString(self.address)
+        if tvip: return tvip
+        tvudn = devices.findByName(self.address)
+        if not tvudn: return ''
+        return devices.resolve(tvudn) or devices.get(tvudn).get('ip', '')
+
+    def isBehind(self, mode):
+        return self.curTVmode != mode and not self.tracker.isOffline()
+
+    def onOnline(self):
+        # Called on the tracker thread
+        xbmc.log("3D Enabler::TVTarget::onOnline: TV " + str(self.address) + " is back online", xbmc.LOGINFO)
+        controller.put('trigger')
+
+    def close(self):
+        self.session.close()
+        self.tracker.stop()
+
+def syncTargets():
+    # Sessions of TVs that are still configured are kept
+    global targets
+    try:
+        modes = simplejson.loads(settings.getSetting('extramodes', str) or '{}')
+    except ValueError:
+        modes = {}
+    current = dict((x.address, x) for x in targets)
+    targets = [current.pop(address, None) or TVTarget(address, modes.get(address, 0)) for address in settings.extratvs]
+    for target in current.values():
+        target.close()
+
+def saveTargetModes():
+    with targetsLock:
+        settings.setSetting('extramodes', simplejson.dumps(dict((x.address, x.curTVmode) for x in targets)))
+
+def resolveTVip():
+    # Known TV may have announced a new address - no need to wait for connect timeout and discovery
+    tvudn = settings.tvudn or devices.findByName(settings.tvname)
+    if not tvudn: return
+    tvip = devices.resolve(tvudn)
+    if tvip and tvip != getIPfromString(settings.ipaddress):
+        xbmc.log("3D Enabler::resolveTVip: TV " + str(tvudn) + " is now at " + str(tvip), xbmc.LOGINFO)
+        settings.ipaddress = tvip
+        settings.setSetting('ipaddress', settings.ipaddress)
+
+def rediscoverTV():
+    # Main TV does not answer at its saved address - look for it once. True if it was found elsewhere
+    if not settings.discover: return False
+    xbmc.log("3D Enabler::rediscoverTV: TV is not reachable at " + str(settings.ipaddress) + ". Discovering", xbmc.LOGINFO)
+    tv = discoverTVip()
+    if not tv or tv[0] == getIPfromString(settings.ipaddress): return False
+    settings.ipaddress, settings.tvname, settings.tvudn = tv
+    settings.setSetting('ipaddress', settings.ipaddress)
+    settings.setSetting('tvname', settings.tvname)
+    settings.setSetting('tvudn', settings.tvudn)
+    tracker.poke()
+    return True
+
+def getTrackedIP():
+    tvudn = settings.tvudn or devices.findByName(settings.tvname)
+    return (devices.resolve(tvudn) if tvudn else None) or getIPfromString(settings.ipaddress)
+
+def onTVOnline():
+    # Called on the tracker thread - apply the mode that was wanted while TV was off
+    xbmc.log("3D Enabler::onTVOnline: TV is back online", xbmc.LOGINFO)
+    controller.put('trigger')
+
+def onSSDPNotify(headers):
+    # Called on the listener thread for every Samsung NOTIFY announcement
+    tvudn = registry.udnFromUsn(headers.get('usn'))
+    if headers.get('nts') == 'ssdp:byebye':
+        changed = devices.byebye(tvudn)
+    else:
+        changed = devices.update(tvudn, ip = getIPfromString(headers.get('location', '')), location = headers.get('location'),
+            maxAge = registry.maxAgeFromCache(headers.get('cache-control')))
+    if tvudn and tvudn == settings.tvudn and headers.get('nts') != 'ssdp:byebye':
+        tracker.poke()
+    if changed:
+        xbmc.log("3D Enabler::onSSDPNotify: " + str(tvudn) + " " + str(headers.get('nts')) + " at " + str(headers.get('location')), xbmc.LOGDEBUG)
+        devices.save()
+
+def onSSDPError(e):
+    # TV address changes are then only picked up by discovery
+    xbmc.log("3D Enabler::onSSDPError: Cannot listen for SSDP announcements: " + repr(e), xbmc.LOGWARNING)
+
+def connectTV(discover = True, tvSession = None):
     port = 55000
+    if tvSession and not tvSession.isMain():
+        # Additional TVs are connected at their configured address only
+        tvSession.close()
+        tvip = tvSession.target.resolve()
+        if not tvip: return False
+        tvSession.sock = newSock()
+        try:
+            with stats.span('connect'):
+                tvSession.sock.connect((tvip, port))
+            return True
+        except:
+            xbmc.log("3D Enabler::connectTV: TV " + str(tvSession.target.address) + " is Off or IP is outdated", xbmc.LOGINFO)
+            return False
+    session.close()
+    resolveTVip()
     settings.ipaddress = getIPfromString(settings.ipaddress)
     if bool(settings.ipaddress):
-        settings.sock = newSock()
+        session.sock = newSock()
         try:
-            xbmc.log("3D Enabler::connectTV: Connecting to:" + str(settings.ipaddress) + ":" + str(port), xbmc.LOGDEBUG)
-            settings.sock.connect((settings.ipaddress, port))
+            logDebug("3D Enabler::connectTV: Connecting to:%s:%d", settings.ipaddress, port)
+            with stats.span('connect'):
+                session.sock.connect((settings.ipaddress, port))
             return True
         except:
             xbmc.log("3D Enabler::connectTV: TV is Off or IP is outdated", xbmc.LOGINFO)
+    if not discover:
+        return False
     if settings.discover:
         tv = discoverTVip()
         if tv:
-            settings.sock = newSock()
+            session.sock = newSock()
             try:
-                xbmc.log("3D Enabler::connectTV: Connecting to:" + str(tv[0]) + ":" + str(port), xbmc.LOGDEBUG)
-                settings.sock.connect((tv[0], port))
+                logDebug("3D Enabler::connectTV: Connecting to:%s:%d", tv[0], port)
+                with stats.span('connect'):
+                    session.sock.connect((tv[0], port))
                 settings.ipaddress = tv[0]
                 settings.tvname = tv[1]
+                settings.tvudn = tv[2]
                 settings.setSetting('ipaddress', settings.ipaddress)
                 settings.setSetting('tvname', settings.tvname)
+                settings.setSetting('tvudn', settings.tvudn)
                 return True
             except:
                 xbmc.log("3D Enabler::connectTV: TV is Off or IP is outdated", xbmc.LOGINFO)
@@ -390,93 +910,263 @@ def connectTV():
         toNotify(settings.getLocalizedString(30507)) #Discovery is turned off
     return False
 
-def processSequence(commandSequence):
+def processSequence(instructions, tvSession = None, barrier = None):
+    # Kodi side commands are executed for the main TV only. With several TVs the barrier holds
+    # the closing part of the sequence until every TV has sent its keys
+    tvSession = tvSession or session
+    isMain = tvSession.isMain()
+    goal = settings.newTVmode
     putOnPause = False
-    # Parse commands and execute them
-    for x in commandSequence.split(','):
-        thisKey = x.strip().upper()
-        if thisKey in keyMap:
-            xbmc.log("3D Enabler::processSequence: Sending " + thisKey + " as Key: " + keyMap[thisKey], xbmc.LOGDEBUG)
-            sendKey(keyMap[thisKey])
-        elif thisKey[:3] == 'KEY':
-            xbmc.log("3D Enabler::processSequence: Sending Key: " + thisKey, xbmc.LOGDEBUG)
-            sendKey(thisKey)
-        elif thisKey == 'PAUSE':
-            if settings.pause:
-                if xbmc.Player().isPlayingVideo():
-                    if not xbmc.getCondVisibility('Player.Paused'):
+    cancelled = False
+    closing = False
+    lastKey = None
+    success = True
+    profile = profiles.profile(tvSession.tvid())
+    if settings.adaptive:
+        profile.beginTrial()
+    # Execute compiled instructions
+    for instruction in instructions:
+        command = instruction[0]
+        # After cancellation only the closing part of the sequence is executed
+        if cancelled and command != 'END': continue
+        if command == 'KEY':
+            logDebug("3D Enabler::processSequence: Sending Key: %s", instruction[1])
+            tvSession.queueFrame(instruction[1], instruction[2])
+            lastKey = instruction[1]
+            continue
+        # Consecutive keys are written together - flush them before any other command
+        if not tvSession.flush():
+            success = False
+            # Keys never reached the TV - current mode stays at the last one that was sent,
+            # so the switch is repeated once the TV is back
+            if not closing: cancelled = True
+            if cancelled and command != 'END': continue
+        if command == 'PAUSE':
+            if settings.pause and isMain:
+                state.refresh()
+                if state.hasVideo:
+                    if not state.paused:
                         xbmc.log("3D Enabler::processSequence: Pause XBMC", xbmc.LOGDEBUG)
                         xbmc.Player().pause()
                         putOnPause = True
-        elif thisKey == 'PLAY':
-            if settings.pause:
+        elif command == 'PLAY':
+            if settings.pause and putOnPause and isMain:
                 if xbmc.Player().isPlayingVideo():
                     if xbmc.getCondVisibility('Player.Paused'):
                         xbmc.log("3D Enabler::processSequence: Resume XBMC", xbmc.LOGDEBUG)
-                        if putOnPause: xbmc.Player().pause()
-        elif thisKey[:1] == 'P':
-            xbmc.log("3D Enabler::processSequence: Waiting for " + thisKey[1:] + " milliseconds", xbmc.LOGDEBUG)
-            xbmc.sleep(int(thisKey[1:]))
-        elif thisKey == 'BLACKON':
-            if settings.black:
+                        xbmc.Player().pause()
+        elif command == 'WAIT':
+            delay = instruction[1]
+            if settings.adaptive and lastKey:
+                # Shortest delay that has proven reliable for this TV
+                delay = profile.delayFor(lastKey, delay)
+            logDebug("3D Enabler::processSequence: Waiting for %d milliseconds", delay)
+            xbmc.sleep(delay)
+        elif command == 'BLACKON':
+            if settings.black and isMain:
                 xbmc.log("3D Enabler::processSequence: Screen to Black", xbmc.LOGDEBUG)
                 blackScreen.show()
-        elif thisKey == 'BLACKOFF':
-            if settings.black:
+        elif command == 'BLACKOFF':
+            if settings.black and isMain:
                 xbmc.log("3D Enabler::processSequence: Screen from Black", xbmc.LOGDEBUG)
                 blackScreen.close()
-        else:
-            xbmc.log("3D Enabler::processSequence: Unknown command: " + thisKey, xbmc.LOGWARNING)
+        elif command == 'MODE':
+            # Safe key boundary - TV has settled in this 3D mode
+            if isMain:
+                settings.curTVmode = instruction[1]
+                settings.setSetting('curTVmode', settings.curTVmode)
+            else:
+                tvSession.target.curTVmode = instruction[1]
+                saveTargetModes()
+            if controller.preempted():
+                state.refresh(True)
+                if state.translatedMode() != goal:
+                    xbmc.log("3D Enabler::processSequence: Target mode changed to " + str(state.translatedMode()) + ". Cancelling at mode " + str(instruction[1]), xbmc.LOGINFO)
+                    if isMain: settings.newTVmode = state.translatedMode()
+                    cancelled = True
+        elif command == 'END':
+            cancelled = False
+            closing = True
+            arrive(barrier)
+    if not tvSession.flush(): success = False
+    if settings.adaptive:
+        # Only a switch whose keys have all been acknowledged may shorten delays
+        profile.endTrial(success and tvSession.waitForAcks())
+        profiles.save()
     xbmc.log("3D Enabler::processSequence: Done with sequence")
 
+class SwitchBarrier(object):
+    '''Holds the closing part of a parallel switch until every TV sending keys has sent them.
+    The main TV always takes part. Additional TVs join once they are connected, so a TV that
+    is slow to connect or off never keeps the screen black. TVs joining after the barrier
+    has been released do not wait'''
+    def __init__(self, timeout = barrierTimeout):
+        self.timeout    = timeout
+        self.parties    = 1         # main TV
+        self.arrived    = 0
+        self.released   = False
+        self.cond       = threading.Condition()
+
+    def join(self):
+        with self.cond:
+            if self.released: return False
+            self.parties += 1
+            return True
+
+    def leave(self):
+        # Joined TV that will never arrive
+        with self.cond:
+            self.parties -= 1
+            self.cond.notify_all()
+
+    def wait(self):
+        deadline = time.monotonic() + self.timeout
+        with self.cond:
+            self.arrived += 1
+            while not self.released and self.arrived < self.parties:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: break
+                self.cond.wait(remaining)
+            self.released = True
+            self.cond.notify_all()
+
+def arrive(barrier):
+    # Wait until every TV of a parallel switch has finished its keys
+    if barrier: barrier.wait()
+
+def switchTarget(target, mode, barrier):
+    # Runs on the worker pool for an additional TV
+    joined = False
+    try:
+        # Session failures mark the target offline, so it is skipped until it answers again
+        if not target.session.open(False):
+            xbmc.log("3D Enabler::switchTarget: Cannot connect to TV " + str(target.address), xbmc.LOGINFO)
+            return
+        instructions = settings.modeGraph.compile(target.curTVmode, mode)
+        if instructions is None:
+            xbmc.log("3D Enabler::switchTarget: No key sequence from mode " + str(target.curTVmode) + " to " + str(mode), xbmc.LOGERROR)
+            return
+        # Other TVs only wait for us once we are connected
+        joined = bool(barrier and barrier.join())
+        processSequence(instructions, target.session, barrier if joined else None)
+    except Exception as e:
+        xbmc.log("3D Enabler::switchTarget: Switching TV " + str(target.address) + " failed: " + repr(e), xbmc.LOGERROR)
+        target.session.close()
+        target.tracker.markOffline()
+        # Do not keep other TVs waiting for us
+        if joined: barrier.leave()
+
+def getWorkers():
+    global workers
+    if workers is None:
+        import concurrent.futures
+        workers = concurrent.futures.ThreadPoolExecutor(max_workers = maxWorkers)
+    return workers
+
 def mainStereoChange():
+    started = time.monotonic()
     if stereoModeHasChanged():
-        if not connectTV():
-            toNotify(settings.getLocalizedString(30508)) #Connection Failed
-            # Authenticate and action
-        elif authenticate():
+        # Additional TVs are switched in parallel on the worker pool
+        behind = [x for x in targets if x.isBehind(settings.newTVmode)]
+        barrier = SwitchBarrier() if behind else None
+        switches = [getWorkers().submit(switchTarget, x, settings.newTVmode, barrier) for x in behind]
+        sequenceStarted = False
+        if settings.curTVmode == settings.newTVmode:
+            xbmc.log("3D Enabler::mainStereoChange: Main TV is in sync. Switching additional TVs only", xbmc.LOGDEBUG)
+        elif tracker.isOffline():
+            # Do not wait for connect timeouts - desired mode is applied once TV is back
+            xbmc.log("3D Enabler::mainStereoChange: TV is offline. Mode " + str(settings.newTVmode) + " will be applied when it is back", xbmc.LOGINFO)
+        # Connect and authenticate unless we already hold a live session
+        elif session.open():
             # Checking again as mode could have changed during long authentication process
             if settings.authCount > 1:
-                settings.newTVmode = getTranslatedStereoscopicMode()
-            if stereoModeHasChanged():
+                state.refresh(True)
+                settings.newTVmode = state.translatedMode()
+            if settings.curTVmode != settings.newTVmode:
                 xbmc.log("3D Enabler::mainStereoChange: Stereoscopic Mode changed: curTVmode:newTVmode = " + str(settings.curTVmode) + ":" + str(settings.newTVmode), xbmc.LOGDEBUG)
-                # Action Assignment
-                if settings.newTVmode == 1: commandSequence = settings.sequence3DTAB
-                elif settings.newTVmode == 2: commandSequence = settings.sequence3DSBS
-                else: commandSequence = settings.sequence3Dnone
-                
-                if (settings.curTVmode != 0) and (settings.newTVmode != 0):
-                    # We need to transition from one 3D mode to another
-                    commandSequence = settings.sequenceBegin + ',' + settings.sequence3Dnone + ',' + commandSequence + ',' + settings.sequenceEnd
+                # Cheapest key path between current and new mode. MODE markers save current 3D mode
+                # at safe boundaries where the switch can be cancelled
+                instructions = settings.modeGraph.compile(settings.curTVmode, settings.newTVmode)
+                if instructions is None:
+                    xbmc.log("3D Enabler::mainStereoChange: No key sequence from mode " + str(settings.curTVmode) + " to " + str(settings.newTVmode), xbmc.LOGERROR)
                 else:
-                    # We need to switch from none to 3D mode
-                    commandSequence = settings.sequenceBegin + ',' + commandSequence + ',' + settings.sequenceEnd
-                processSequence(commandSequence)
-                # Saving current 3D mode
-                settings.curTVmode = settings.newTVmode
-                settings.setSetting('curTVmode', settings.newTVmode)
+                    sequenceStarted = True
+                    with stats.span('sequence'):
+                        processSequence(instructions, session, barrier)
             else:
                 xbmc.log("3D Enabler::mainStereoChange: Stereoscopic Mode is the same", xbmc.LOGINFO)
-        
-        else:
-            toNotify(settings.getLocalizedString(30509)) #Authentication Failed
-        
-        # Close the socket
-        if settings.sock:
-            settings.sock.close()
+        if not sequenceStarted: arrive(barrier)
+        for switch in switches: switch.result()
+        if sequenceStarted or switches:
+            # Whole switch including connect and authentication
+            stats.record('switch', time.monotonic() - started)
+            stats.save()
     else:
         xbmc.log("3D Enabler::mainStereoChange: Stereoscopic mode has not changed", xbmc.LOGDEBUG)
     # Notify of all messages
     notify()
 
+def getPlayingFile():
+    try:
+        return xbmc.Player().getPlayingFile()
+    except RuntimeError:
+        return ''
+
+def isStereoscopicPlayback():
+    # Cheap hints available right at playback start, before Stereoscopic Manager has settled
+    if xbmc.getInfoLabel('VideoPlayer.StereoscopicMode') not in ('', 'mono', 'off'): return True
+    return bool(stereoMarkers.search(getPlayingFile()))
+
+def prewarmSession():
+    # Connect and authenticate while playback is starting so the switch itself only sends keys
+    if tracker.isOffline() or session.isReady(): return
+    if not isStereoscopicPlayback(): return
+    xbmc.log("3D Enabler::prewarmSession: Stereoscopic video is starting. Opening session ahead", xbmc.LOGDEBUG)
+    if session.open(False):
+        session.prewarmed = time.monotonic()
+
+def switchFromCache():
+    # Known 3D title - switch right away. The debounced trigger verifies the mode Kodi has actually chosen
+    playingFile = getPlayingFile()
+    if not playingFile: return False
+    mode = titles.get(playingFile)
+    if mode is None: return False
+    xbmc.log("3D Enabler::switchFromCache: Cached mode for playing title: " + str(mode), xbmc.LOGDEBUG)
+    settings.newTVmode = mode
+    state.predicted = True
+    mainStereoChange()
+    return True
+
+def learnTitleMode():
+    # Remember mode of the playing title. Entries that turned out wrong are corrected or evicted
+    if not state.hasVideo or state.stereomode not in stereoscopicModeMap: return
+    playingFile = getPlayingFile()
+    if not playingFile: return
+    cached = titles.get(playingFile)
+    if cached == settings.newTVmode: return
+    # Only stereoscopic titles are cached - nothing to learn from a 2D one that is not there
+    if cached is None and not settings.newTVmode: return
+    if cached is not None:
+        xbmc.log("3D Enabler::learnTitleMode: Cached mode " + str(cached) + " was wrong. Actual mode: " + str(settings.newTVmode), xbmc.LOGINFO)
+    if settings.newTVmode:
+        titles.put(playingFile, settings.newTVmode)
+    elif not titles.evict(playingFile):
+        return
+    titles.save()
+
+def onPlaybackStart():
+    if not switchFromCache():
+        prewarmSession()
+
 def mainTrigger():
-    if not settings.inProgress:
-        settings.inProgress = True
-        settings.newTVmode = getTranslatedStereoscopicMode()
-        xbmc.log("3D Enabler::mainTrigger: settings.newTVmode:" + str(settings.newTVmode), xbmc.LOGDEBUG)
-        if stereoModeHasChanged():
-            mainStereoChange()
-        settings.inProgress = False
+    # Nothing to do if Kodi state is the same and TV is already in sync
+    if not state.refresh() and not stereoModeHasChanged() and not state.predicted: return
+    state.predicted = False
+    settings.newTVmode = state.translatedMode()
+    learnTitleMode()
+    logDebug("3D Enabler::mainTrigger: settings.newTVmode:%s", settings.newTVmode)
+    if stereoModeHasChanged():
+        mainStereoChange()
 
 def onAbort():
     # On exit switch TV back to None 3D
@@ -484,13 +1174,30 @@ def onAbort():
     if stereoModeHasChanged():
         xbmc.log("3D Enabler::onAbort: Exit procedure: changing back to None 3D", xbmc.LOGINFO)
         mainStereoChange()
+    session.close()
+    for target in targets:
+        target.close()
+
+def deferredStartup():
+    # Work not needed for Kodi to come up - runs in the first idle slot or on the first playback event
+    global startupDone
+    if startupDone: return
+    startupDone = True
+    started = time.monotonic()
+    settings.curTVmode = getTranslatedStereoscopicMode()
+    settings.setSetting('curTVmode', settings.curTVmode)
+    checkAndDiscover()
+    xbmc.log("3D Enabler::deferredStartup: Completed in %d ms" % ((time.monotonic() - started) * 1000), xbmc.LOGINFO)
 
 def checkAndDiscover():
     if not settings.ipaddress:
         if settings.discover:
             if dialog.yesno(settings.addonname, settings.getLocalizedString(30515), settings.getLocalizedString(30518), settings.getLocalizedString(30519)):    #Your Samsung TV is not defined yet    #If it is connected to your network - it can be discovered    #Do you want to discover TV now?
                 if connectTV():
-                    authenticate()
+                    if authenticate():
+                        session.ready()
+                    else:
+                        session.close()
                 else:
                     if dialog.yesno(settings.addonname, settings.getLocalizedString(30515), settings.getLocalizedString(30518), settings.getLocalizedString(30517)):    #Your Samsung TV is not defined yet    #If it is connected to your network - it can be discovered    #Do you want to discover TV now?
                         settings.ipaddress = dialog.numeric(3, settings.getLocalizedString(30517), settings.ipaddress)
@@ -501,20 +1208,198 @@ def checkAndDiscover():
                 __addon__.openSettings()
     notify()
 
+def getTransportPorts():
+    return tuple(port for transport in transportMap[settings.transport] for port in transportPorts[transport])
+
+def updateRecorder():
+    # Protocol trace is opt-in. A new trace replaces the previous one every time tracing is turned on
+    global recorder
+    if settings.tracing and not recorder:
+        path = os.path.join(xbmcvfs.translatePath(__addon__.getAddonInfo('profile')), 'trace.bin')
+        xbmc.log("3D Enabler::updateRecorder: Recording protocol trace to " + path, xbmc.LOGINFO)
+        recorder = trace.TraceRecorder(path)
+    elif recorder and not settings.tracing:
+        xbmc.log("3D Enabler::updateRecorder: Protocol trace stopped", xbmc.LOGINFO)
+        recorder.close()
+        recorder = None
+
+def traceSSDP(outgoing, datagram):
+    if recorder: recorder.record(trace.SSDP_SEND if outgoing else trace.SSDP_RECV, datagram)
+
+def applySettings():
+    # React only to what has actually changed - unrelated edits must not cause any network work
+    changed = settings.load()
+    if changed.intersection(['ipaddress', 'tvname', 'tvudn', 'transport']):
+        if session.ipaddress != getIPfromString(settings.ipaddress) or (session.transport and session.transport not in transportMap[settings.transport]):
+            session.close()
+            tracker.poke()
+        tracker.ports = getTransportPorts()
+        for target in targets:
+            target.tracker.ports = tracker.ports
+    if 'extratvs' in changed:
+        syncTargets()
+    if 'tracing' in changed:
+        updateRecorder()
+    if changed.intersection(['detectmode', 'pollsec', 'idlesec']):
+        detector.reset()
+    if changed.intersection(['ipaddress', 'discover']):
+        checkAndDiscover()
+    # Invalid commands in edited sequences
+    notify()
+
+class Controller(threading.Thread):
+    '''Worker thread that owns all TV I/O, authentication and key sequences.
+    Monitor callbacks and the main loop only enqueue commands and return immediately.
+    Repeated commands are coalesced and delayed ones are debounced, so a burst of
+    notifications results in a single switch to the final target mode'''
+    maxDebounce = 2
+
+    def __init__(self):
+        threading.Thread.__init__(self, name='3DEnablerController')
+        self.daemon     = True
+        self.pending    = collections.OrderedDict()    # command -> [first queued, due]
+        self.cond       = threading.Condition()
+        self.lock       = threading.Lock()
+        self.preempt    = threading.Event()
+        self.stopping   = False
+
+    def put(self, command, delay = 0):
+        now = time.monotonic()
+        with self.cond:
+            if command in self.pending:
+                # Debounce - push the command back but never beyond maxDebounce from the first request
+                first, due = self.pending[command]
+                self.pending[command] = [first, min(max(due, now + delay), first + self.maxDebounce)]
+            else:
+                self.pending[command] = [now, now + delay]
+            self.cond.notify()
+        if command == 'trigger' and self.lock.locked():
+            # Let a running sequence know that target may have changed
+            self.preempt.set()
+
+    def preempted(self):
+        return self.preempt.is_set()
+
+    def next(self):
+        with self.cond:
+            while not self.stopping:
+                if self.pending:
+                    command = min(self.pending, key = lambda x: self.pending[x][1])
+                    wait = self.pending[command][1] - time.monotonic()
+                    if wait <= 0:
+                        del self.pending[command]
+                        return command
+                    self.cond.wait(wait)
+                else:
+                    self.cond.wait()
+        return None
+
+    def run(self):
+        while not monitor.abortRequested():
+            command = self.next()
+            if command is None: break
+            with self.lock:
+                try:
+                    self.execute(command)
+                except Exception as e:
+                    xbmc.log("3D Enabler::Controller::run: Command " + str(command) + " failed: " + repr(e), xbmc.LOGERROR)
+
+    def execute(self, command):
+        # Anything but keepalive needs the deferred startup work done first
+        if command != 'keepalive': deferredStartup()
+        if command == 'startup':
+            pass
+        elif command == 'trigger':
+            self.preempt.clear()
+            mainTrigger()
+        elif command == 'settings':
+            applySettings()
+        elif command == 'playback':
+            onPlaybackStart()
+        elif command == 'keepalive':
+            session.keepalive()
+            for target in targets:
+                target.session.keepalive()
+        else:
+            xbmc.log("3D Enabler::Controller::execute: Unknown command: " + str(command), xbmc.LOGWARNING)
+
+    def stop(self):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify()
+        if self.is_alive():
+            self.join(10)
+
+class Detector(object):
+    '''Decides when stereoscopic mode has to be checked.
+    Kodi notifications trigger an immediate check. Polling is only a bounded fallback
+    that backs off exponentially while no video is playing'''
+    triggerMethods  = ['Player.OnAVStart', 'Player.OnAVChange', 'Player.OnPlay', 'Player.OnResume', 'Player.OnStop']
+    videoMethods    = ['Player.OnAVStart', 'Player.OnAVChange', 'Player.OnPlay', 'Player.OnResume']
+    playbackMethods = ['Player.OnPlay', 'Player.OnAVStart']
+    maxBackoff      = 16
+    maxWait         = 30
+
+    def __init__(self):
+        self.backoff    = 1
+        self.nextPoll   = 0
+        self.schedule()
+
+    def interval(self):
+        if settings.detectmode == 2: return settings.pollsec
+        if state.hasVideo: return settings.pollsec
+        return settings.pollsec * self.backoff
+
+    def schedule(self):
+        self.nextPoll = time.monotonic() + max(1, self.interval())
+
+    def reset(self):
+        # Something happened - poll again soon
+        self.backoff = 1
+        self.schedule()
+
+    def wait(self):
+        # Seconds main loop may sleep before anything is due
+        if settings.detectmode == 1: return self.maxWait
+        return min(self.maxWait, max(0, self.nextPoll - time.monotonic()))
+
+    def poll(self):
+        if settings.detectmode == 1: return
+        if time.monotonic() < self.nextPoll: return
+        if not settings.inScreensaver:
+            if xbmc.getGlobalIdleTime() <= settings.idlesec:
+                logDebug("3D Enabler::Detector::poll: Fallback poll (backoff %d)", self.backoff)
+                controller.put('trigger')
+        if settings.detectmode != 2 and not state.hasVideo:
+            self.backoff = min(self.maxBackoff, self.backoff * 2)
+        else:
+            self.backoff = 1
+        self.schedule()
+
+    def onNotification(self, method):
+        if method not in self.triggerMethods: return
+        if method in self.videoMethods and not xbmc.Player().isPlayingVideo(): return
+        logDebug("3D Enabler::Detector::onNotification: Trigger: %s", method)
+        self.reset()
+        if tracker.isOffline(): tracker.poke()
+        if method in self.playbackMethods: controller.put('playback')
+        #Small delay to ensure Stereoscopic Manager completed changing mode
+        controller.put('trigger', 0.5)
+
 class MyMonitor(xbmc.Monitor):
     def __init__(self, *args, **kwargs):
         xbmc.Monitor.__init__(self)
     
     def onSettingsChanged( self ):
         xbmc.log("3D Enabler::MyMonitor::onSettingsChanged: Settings changed", xbmc.LOGDEBUG)
-        settings.load()
-        checkAndDiscover()
+        controller.put('settings')
     
     def onScreensaverDeactivated(self):
         # If detect mode is poll only - do not react on events
         if settings.detectmode == 2: return
         xbmc.log("3D Enabler::MyMonitor::onScreensaverDeactivated: Screensaver Deactivated", xbmc.LOGDEBUG)
         settings.inScreensaver = False
+        detector.reset()
     
     def onScreensaverActivated(self):
         # If detect mode is poll only - do not react on events
@@ -526,40 +1411,51 @@ class MyMonitor(xbmc.Monitor):
     def onNotification(self, sender, method, data):
         # If detect mode is poll only - do not react on events
         if settings.detectmode == 2: return
-        xbmc.log("3D Enabler::MyMonitor::onNotification: Notification Received: " + str(sender) + ": " + str(method) + ": " + str(data), xbmc.LOGDEBUG)
-        if method == 'Player.OnPlay':
-            if xbmc.Player().isPlayingVideo():
-                xbmc.log("3D Enabler::MyMonitor::onNotification: Trigger: " + str(method), xbmc.LOGDEBUG)
-                #Small delay to ensure Stereoscopic Manager completed changing mode
-                xbmc.sleep(500)
-                mainTrigger()
-        elif method == 'Player.OnStop':
-            xbmc.log("3D Enabler::MyMonitor::onNotification: Trigger: " + str(method), xbmc.LOGDEBUG)
-            #Small delay to ensure Stereoscopic Manager completed changing mode
-            xbmc.sleep(500)
-            mainTrigger()
+        logDebug("3D Enabler::MyMonitor::onNotification: Notification Received: %s: %s: %s", sender, method, data)
+        detector.onNotification(method)
 
 def main():
     xbmc.log("3D Enabler::main: Begin", xbmc.LOGINFO)
-    global dialog, dialogprogress, blackScreen, responseMap, settings, monitor
+    refreshLogLevel()
+    global dialog, dialogprogress, blackScreen, responseMap, settings, monitor, session, profiles, detector, state, controller, devices, tracker, tokens, titles, stats
     monitor = MyMonitor()
     dialog = xbmcgui.Dialog()
     dialogprogress = xbmcgui.DialogProgress()
     blackScreen = xbmcgui.Window(-1)
     responseMap = responsePayloadMapping()
     settings = Settings()
-    checkAndDiscover()
+    session = TVSession()
+    profiles = timing.TimingProfiles(os.path.join(xbmcvfs.translatePath(__addon__.getAddonInfo('profile')), 'timing.json'))
+    devices = registry.DeviceRegistry(os.path.join(xbmcvfs.translatePath(__addon__.getAddonInfo('profile')), 'devices.json'))
+    tokens = wsremote.TokenStore(os.path.join(xbmcvfs.translatePath(__addon__.getAddonInfo('profile')), 'tokens.json'))
+    stats = metrics.Metrics(os.path.join(xbmcvfs.translatePath(__addon__.getAddonInfo('profile')), 'stats.json'))
+    updateRecorder()
+    syncTargets()
+    titles = titlecache.TitleModeCache(os.path.join(xbmcvfs.translatePath(__addon__.getAddonInfo('profile')), 'titles.json'))
+    listener = ssdp.NotifyListener(onSSDPNotify, onError = onSSDPError)
+    listener.start()
+    tracker = reachability.ReachabilityTracker(getTrackedIP, getTransportPorts(), onOnline = onTVOnline)
+    tracker.start()
+    state = KodiState()
+    detector = Detector()
+    controller = Controller()
+    controller.start()
+    # Stereo mode query and discovery wait for an idle slot or the first playback event
+    controller.put('startup', startupDelay)
+    xbmc.log("3D Enabler::main: Started in %d ms" % ((time.monotonic() - startTime) * 1000), xbmc.LOGINFO)
     while not monitor.abortRequested():
-        if settings.detectmode != 1:
-            if not settings.inScreensaver:
-                settings.pollCount += 1
-                if xbmc.getGlobalIdleTime() <= settings.idlesec:
-                    if settings.pollCount > settings.pollsec:
-                        mainTrigger()
-                        settings.pollCount = 0
-                        continue
-        monitor.waitForAbort(1)
-    onAbort()
+        refreshLogLevel()
+        detector.poll()
+        controller.put('keepalive')
+        monitor.waitForAbort(detector.wait())
+    controller.stop()
+    listener.stop()
+    tracker.stop()
+    with controller.lock:
+        onAbort()
+    if workers: workers.shutdown(wait = False)
+    if recorder: recorder.close()
+    stats.save()
     xbmc.log("3D Enabler::main: End", xbmc.LOGINFO)
 
 if __name__ == '__main__':